@@ -29,6 +29,10 @@ setuptools.setup(
         'nltk',
         'tensorflow'
     ],
+    extras_require={
+        # Speeds up the search for similar symbol names
+        'fuzzy': ['rapidfuzz>=3'],
+    },
     package_data={
         'stexls': ['*.model']
     }
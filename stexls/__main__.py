@@ -5,10 +5,10 @@ stdin and stdout. After the starver has started,  '''
 import asyncio
 import logging
 from argparse import REMAINDER, ArgumentParser
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version as package_version
 from pathlib import Path
 
-import pkg_resources
-
 from .linter.cli import linter
 from .lsp.cli import lsp
 from .vscode import DiagnosticSeverity
@@ -19,8 +19,8 @@ log = logging.getLogger(__name__)
 if __name__ == '__main__':
     parser = ArgumentParser()
     try:
-        version = pkg_resources.require('stexls')[0].version
-    except Exception:
+        version = package_version('stexls')
+    except PackageNotFoundError:
         version = 'undefined'
     parser.add_argument('--version', '-V', action='version', version=version)
     subparsers = parser.add_subparsers(dest='command', required=True)
@@ -53,6 +53,9 @@ if __name__ == '__main__':
     linter_cmd.add_argument(
         '--verbose', '-v', action='store_true',
         help='If enabled, instead of only printing errors, this will print all infos about each input file.')
+    linter_cmd.add_argument(
+        '--num-jobs', '-j', type=int, default=1,
+        help='Number of processes used for linting.')
 
     lsp_cmd = subparsers.add_parser(
         'lsp', help='Start the language server protocol.')
@@ -73,6 +76,13 @@ if __name__ == '__main__':
     if cmd == 'linter':
         asyncio.run(linter(**args))
     elif cmd == 'lsp':
+        try:
+            # Use the libuv based event loop for the server if it is available
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            pass
+
         async def await_lsp():
             server, task = await lsp(**args)
             await task
@@ -210,8 +210,13 @@ class JsonRpcConnection:
         parser = MessageParser(obj)
         log.debug(
             "Parsed message (%i valid, %i errors).", len(parser.valid), len(parser.errors))
-        responses = await asyncio.gather(
-            *map(self._handle_message, parser.valid))
+        if len(parser.valid) == 1:
+            # Most messages are not batched: Handle them directly
+            # instead of wrapping them in another task with gather()
+            responses = [await self._handle_message(parser.valid[0])]
+        else:
+            responses = await asyncio.gather(
+                *map(self._handle_message, parser.valid))
         filtered_responses: List[ResponseObject] = list(
             filter(None, responses))
         responses_and_errors = filtered_responses + parser.errors
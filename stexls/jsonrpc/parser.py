@@ -19,12 +19,8 @@ class MessageParser:
         self.valid: List[MessageObject] = []
         self.errors: List[ResponseObject] = []
         self.is_batch: bool = False
-        invalid = validate_json(o)
-        if invalid is not None:
-            self.errors.append(invalid)
-        elif isinstance(o, dict):
-            self.valid.append(restore_message(o))
-        elif isinstance(o, list):
+        if isinstance(o, list) and o:
+            # A batch is validated item by item, so that one invalid message does not reject the others
             self.is_batch = True
             for item in o:
                 invalid = validate_json(item)
@@ -32,6 +28,12 @@ class MessageParser:
                     self.valid.append(restore_message(item))
                 else:
                     self.errors.append(invalid)
+        else:
+            invalid = validate_json(o)
+            if invalid is not None:
+                self.errors.append(invalid)
+            else:
+                self.valid.append(restore_message(o))
 
     def make_responses(self, message_handler: Callable[[MessageObject], Optional[ResponseObject]]) -> List[ResponseObject]:
         """ Shortcut for handling valid messages and appending the invalid inputs to the responses of the handler.
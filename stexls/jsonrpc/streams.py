@@ -3,9 +3,49 @@ import json
 import re
 from typing import Any, Dict
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 __all__ = ['JsonStream']
 
 
+def _serializer(child):
+    ' Fallback serializer for objects neither json nor orjson know how to encode. '
+    try:
+        if hasattr(child, 'to_json') and callable(child.to_json):
+            return child.to_json()
+        elif hasattr(child, 'serialize') and callable(child.serialize):
+            return child.serialize()
+    except Exception:
+        pass
+    return dict(child.__dict__.items())
+
+
+def _dumps(json_object: Any, charset: str) -> bytes:
+    ''' Serializes the object to bytes using orjson if available and the builtin json module else.
+
+    orjson always writes utf-8, so other charsets use the builtin json module,
+    which escapes all non-ascii characters and can therefore be encoded with any charset.
+    '''
+    if orjson is not None and charset.lower().replace('-', '') == 'utf8':
+        return orjson.dumps(
+            json_object,
+            default=_serializer,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(json_object, default=_serializer).encode(charset)
+
+
+def _loads(content: bytes, charset: str) -> Any:
+    ' Deserializes the bytes using orjson if available and the builtin json module else. '
+    if orjson is not None:
+        if charset.lower().replace('-', '') != 'utf8':
+            content = content.decode(charset).encode('utf-8')
+        return orjson.loads(content)
+    return json.loads(content.decode(charset))
+
+
 class JsonStream:
     """ A JsonStream implements a modified stream interface
     with read_json() and write_json() which allows to deserialize and
@@ -41,26 +81,23 @@ class JsonStream:
         self.writer.close()
 
     def write_json(self, json_object: Any):
-        ' Serializes the object with json and writes it to the underlying stream writer. '
-        def serializer(child):
-            try:
-                if hasattr(child, 'to_json') and callable(child.to_json):
-                    return child.to_json()
-                elif hasattr(child, 'serialize') and callable(child.serialize):
-                    return child.serialize()
-            except Exception:
-                pass
-            return dict(child.__dict__.items())
-        serialized = json.dumps(json_object, default=serializer)
-        content = serialized.encode(self.charset)
-        length_header = f'Content-Length: {len(content)}'.encode(self.encoding)
-        if self.with_content_type:
-            type_header = f'Content-Type: application/json; charset={self.charset}'.encode(
-                self.encoding)
-        self.writer.write(length_header + self.newline)
+        ''' Serializes the object with json and writes it to the underlying stream writer.
+
+        Headers and content are buffered and written with a single call
+        so that each message results in only one write to the transport.
+        '''
+        content = _dumps(json_object, self.charset)
+        message = [
+            f'Content-Length: {len(content)}'.encode(self.encoding),
+            self.newline,
+        ]
         if self.with_content_type:
-            self.writer.write(type_header + self.newline)
-        self.writer.write(self.newline + content)
+            message.append(
+                f'Content-Type: application/json; charset={self.charset}'.encode(self.encoding))
+            message.append(self.newline)
+        message.append(self.newline)
+        message.append(content)
+        self.writer.write(b''.join(message))
 
     async def read_json(self) -> Any:
         r''' Read a json object from stream, parse and return it.
@@ -91,8 +128,7 @@ class JsonStream:
         content = await self.reader.readexactly(content_length)
         if not content:
             raise EOFError()
-        serialized = content.decode(charset)
-        return json.loads(serialized)
+        return _loads(content, charset)
 
     async def read_headers(self) -> Dict[str, str]:
         r''' Reads a dict of headers to header values from stream.
@@ -104,14 +140,13 @@ class JsonStream:
 
         where the header name is a string separated by a colon from the value.
         The line needs to end with "\r\n".
+
+        The whole header block, up to and including the empty line, is read
+        with a single call to the underlying stream reader.
         '''
         headers: Dict[str, str] = {}
-        while True:
-            raw_line: bytes = await self.reader.readline()
-            if raw_line == self.newline:
-                return headers
-            if not raw_line:
-                raise EOFError()
+        raw_headers: bytes = await self.reader.readuntil(self.newline + self.newline)
+        for raw_line in raw_headers.split(self.newline)[:-2]:
             line = raw_line.decode(self.encoding)
             try:
                 header, value = line.split(':', maxsplit=1)
@@ -119,3 +154,4 @@ class JsonStream:
                 raise ValueError(
                     f'Invalid line format in line "{line.strip()}": Missing ":" character.') from e
             headers[header.strip().lower()] = value.strip()
+        return headers
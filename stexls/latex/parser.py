@@ -47,6 +47,8 @@ class Node:
         _parent (Node, optional): Parent node this node belongs to.
             Accessed via the `parent` property getter.
     """
+    # Nodes are created for every token of a file: Slots keep them small
+    __slots__ = ('parser', 'begin', 'end', 'children', '_parent')
 
     def __init__(self, parser: LatexParser, begin: int, end: int):
         """ Creates a node.
@@ -68,7 +70,7 @@ class Node:
         ' Returns the largest scope this is contained in. Use the filter to filter out environment names that constitute a scope. '
         if not self._parent or (isinstance(self, Environment) and (not filter or filter.match(self.env_name))):
             return Location(
-                Path(self.parser.file).as_uri(),
+                self.parser.uri,
                 Range(
                     self.parser.offset_to_position(self.begin),
                     self.parser.offset_to_position(self.end)))
@@ -88,7 +90,7 @@ class Node:
     @property
     def location(self) -> Location:
         " Location of this node in the file. "
-        return Location(Path(self.parser.file).as_uri(), self.range)
+        return Location(self.parser.uri, self.range)
 
     @property
     def range(self) -> Range:
@@ -163,6 +165,7 @@ class Node:
 
 class Token(Node):
     ' A token is a leaf node that contains the actual text of the source file. '
+    __slots__ = ('lexeme',)
 
     def __init__(self, parser: LatexParser, begin: int, end: int, lexeme: str):
         """ Constructs a token with text and position information.
@@ -187,6 +190,8 @@ class Token(Node):
 
 
 class OArgument(Node):
+    __slots__ = ('name', 'value')
+
     def __init__(self, parser: LatexParser, begin: int, end: int):
         super().__init__(parser, begin, end)
         self.name: Optional[Node] = None
@@ -216,6 +221,8 @@ class OArgument(Node):
 
 class MathToken(Token):
     ' A special token that represents an environment that contains math. '
+    __slots__ = ()
+
     @property
     def env_name(self):
         return '$'
@@ -228,6 +235,7 @@ class Environment(Node):
         \\end{name}
         The oargs and rargs do not contain text.
     """
+    __slots__ = ('oargs', 'rargs', 'name')
 
     def __init__(self, parser: LatexParser, begin: int, end: int):
         """ Initializes an environment node with an empty name and empty rarg & oarg arrays.
@@ -318,6 +326,8 @@ class InlineEnvironment(Environment):
         Tokens yielded from inline environments
         are the tokens from <rarg>s.
     """
+    __slots__ = ()
+
     @property
     def tokens(self):
         ' Inline environments only have public tokens in their rargs. '
@@ -344,17 +354,21 @@ class LatexParser:
             encoding (str): Encoding of the file. Defaults to 'utf-8'.
         """
         self.file: Path = Path(file).absolute()
+        # The uri of the file is the same for every node and token location created by this parser
+        self.uri: str = self.file.as_uri()
         self.encoding: str = encoding
         self.source: Optional[str] = None
         self.root: Optional[Node] = None
         self.syntax_errors: List[Tuple[Location, Exception]] = []
         self.parsed = False
 
-    def parse(self, content: Optional[str] = None) -> Node:
+    def parse(self, content: Optional[str] = None, keep_text: bool = True) -> Node:
         """ Actually parses the file given in the constructor.
 
         Parameters:
             content (str, optional): Optional content of the file. If None, then the file is read from disk with open.
+            keep_text (bool): If False, text and math tokens are only added to the syntax tree if they are
+                part of an environment's name or arguments. Defaults to True.
 
         Returns:
             The root node of the parsed file.
@@ -378,7 +392,7 @@ class LatexParser:
         parser.removeErrorListeners()
         error_listener = _SyntaxErrorErrorListener(self.file)
         parser.addErrorListener(error_listener)
-        listener = Listener(self)
+        listener = Listener(self, keep_text=keep_text)
         walker = antlr4.ParseTreeWalker()
         parse_tree = parser.main()
         walker.walk(listener, parse_tree)
@@ -386,6 +400,29 @@ class LatexParser:
         self.root = listener.stack[0]
         return self.root
 
+    def parse_and_walk(
+            self,
+            enter: Callable[[Environment], None],
+            exit: Callable[[Environment], None] = None,
+            content: Optional[str] = None):
+        """ Parses the file and walks through the environments for callers that only need environments.
+
+        The text of the file is not added to the syntax tree and the syntax tree is
+        released after the walk, which makes this cheaper than calling parse() and walk().
+
+        Args:
+            enter (Callable[[Environment], None]): Called the first time the environment is encountered.
+            exit (Callable[[Environment], None], optional):
+                Called when all children of a previously entered environment have been visited.
+                Defaults to None.
+            content (str, optional): Optional content of the file. If None, then the file is read from disk with open.
+        """
+        self.parse(content, keep_text=False)
+        try:
+            self.walk(enter, exit)
+        finally:
+            self.root = None
+
     @staticmethod
     def from_source(source: str) -> LatexParser:
         """ Parses the text from source.
@@ -454,21 +491,22 @@ class LatexParser:
                 Called when all children of a previously entered environment have been visited.
                 Defaults to None.
         """
-        stack = [self.root]
-        visited = []
+        # Entered environments are pushed a second time, marked as entered,
+        # so that exit() is called after all of their children have been visited
+        stack: List[Tuple[Optional[Node], bool]] = [(self.root, False)]
         while stack:
-            current = stack.pop()
+            current, entered = stack.pop()
             if isinstance(current, Environment):
-                if current in visited:
+                if entered:
                     if exit is not None:
                         exit(current)
                 else:
                     enter(current)
-                    stack.append(current)
-                    stack.extend(reversed(current.children))
-                    visited.append(current)
+                    stack.append((current, True))
+                    stack.extend((child, False)
+                                 for child in reversed(current.children))
             elif current is not None:
-                stack.extend(current.children)
+                stack.extend((child, False) for child in current.children)
             else:
                 raise RuntimeError('"current" is None')
 
@@ -496,10 +534,19 @@ class _SyntaxErrorErrorListener(ErrorListener):
 class Listener(_LatexParserListener):
     ' Implements the antlr4 methods for parsing a latex file. '
 
-    def __init__(self, parser: LatexParser):
+    def __init__(self, parser: LatexParser, keep_text: bool = True):
         super().__init__()
         self.parser = parser
         self.stack: List[Node] = []
+        # If False, tokens are only kept inside environment headers
+        self.keep_text = keep_text
+        # Number of currently open environment names and arguments
+        self._headers = 0
+
+    def _add_token(self, token: Token):
+        ' Adds the token to the top of the stack, unless it is text that should not be kept. '
+        if self.keep_text or self._headers:
+            self.stack[-1].add(token)
 
     def enterMain(self, ctx: _LatexParser.MainContext):
         self.stack.append(Node.from_ctx(ctx, self.parser))
@@ -513,7 +560,7 @@ class Listener(_LatexParserListener):
     def exitMath(self, ctx: _LatexParser.MathContext):
         lexeme = str(ctx.MATH_ENV())
         node = MathToken.from_ctx(ctx, self.parser, lexeme=lexeme)
-        self.stack[-1].add(node)
+        self._add_token(node)
 
     def enterBody(self, ctx: _LatexParser.BodyContext):
         if ctx.body():
@@ -528,6 +575,10 @@ class Listener(_LatexParserListener):
     def enterEnvBegin(self, ctx: _LatexParser.EnvBeginContext):
         env = Environment.from_ctx(ctx, self.parser)
         self.stack.append(env)
+        self._headers += 1
+
+    def exitEnvBegin(self, ctx: _LatexParser.EnvBeginContext):
+        self._headers -= 1
 
     def exitEnvEnd(self, ctx: _LatexParser.EnvEndContext):
         env: Node = self.stack.pop()
@@ -557,14 +608,17 @@ class Listener(_LatexParserListener):
         token = Token(self.parser, *env_name_range, lexeme=str(env_name_ctx))
         env.add_name(token)
         self.stack.append(env)
+        # The text of inline environments is in their arguments
+        self._headers += 1
 
     def exitInlineEnv(self, ctx: _LatexParser.InlineEnvContext):
+        self._headers -= 1
         env = self.stack.pop()
         self.stack[-1].add(env)
 
     def exitText(self, ctx: _LatexParser.TextContext):
         token = Token.from_ctx(ctx, self.parser, lexeme=ctx.getText())
-        self.stack[-1].add(token)
+        self._add_token(token)
 
     def enterRarg(self, ctx: _LatexParser.RargContext):
         node = Node.from_ctx(ctx, self.parser)
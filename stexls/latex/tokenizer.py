@@ -6,13 +6,14 @@ environment, location and parse tree structure.
 from __future__ import annotations
 
 import re
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Iterator, List, Optional, Tuple, Union
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 from stexls.latex import parser
 from stexls.vscode import Range
 
-__all__ = ['LatexTokenizer', 'LatexToken']
+__all__ = ['LatexTokenizer', 'LatexToken', 'tokenize_files']
 
 # TODO: Redo the word regex
 DEFAULT_WORDS = (
@@ -105,6 +106,39 @@ class LatexTokenizer:
         return LatexTokenizer(latex_parser.root, lower=lower)
 
 
+def _tokenize_file(file: Union[str, Path], lower: bool = True) -> Optional[List[LatexToken]]:
+    ' Parses and tokenizes a single file. Returns None if the file can not be read or parsed. '
+    try:
+        latex_tokenizer = LatexTokenizer.from_file(file, lower=lower)
+    except OSError:
+        return None
+    if latex_tokenizer is None:
+        return None
+    return list(latex_tokenizer.tokens())
+
+
+def tokenize_files(
+        files: Iterable[Union[str, Path]],
+        num_jobs: Optional[int] = None,
+        chunksize: int = 8) -> Iterator[Optional[List[LatexToken]]]:
+    ''' Parses and tokenizes multiple files in parallel.
+
+    Only the extracted tokens are sent back from the worker processes,
+    not the parse trees.
+
+    Parameters:
+        files: Files to tokenize.
+        num_jobs: Number of worker processes. Defaults to the number of cpus.
+        chunksize: Number of files sent to a worker at once.
+
+    Returns:
+        Iterator of the tokens of each file in the same order as `files`.
+        None is yielded for files that can not be read or parsed.
+    '''
+    with Pool(num_jobs) as pool:
+        yield from pool.imap(_tokenize_file, files, chunksize=chunksize)
+
+
 def _replace_german_characters(text: str) -> str:
     return (text.
             replace('\\ss', 'ß').
@@ -22,7 +22,8 @@ async def linter(
         loglevel: str,
         logfile: Path,
         verbose: bool,
-        ignorefile: Optional[Union[str, Path, PathLike]] = None):
+        ignorefile: Optional[Union[str, Path, PathLike]] = None,
+        num_jobs: int = 1):
     """ Run the language server in linter mode.
 
         In this mode only diagnostics and progress are printed to stdout.
@@ -39,6 +40,7 @@ async def linter(
         logfile: File to which logs will be logged.
         ignorefile (str | Path, optional): Path to the ignorefile.
             If None, `root/.stexlsignore` will be used.
+        num_jobs (int, optional): Number of processes used for linting. Defaults to 1.
 
     Returns:
         Awaitable task.
@@ -57,7 +59,7 @@ async def linter(
     log.debug('Compiler outdir at "%s"', outdir)
 
     def progressfn(it, title, files):
-        log.debug('Progress "%s":%i', title, len(it))
+        log.debug('Progress "%s":%i', title, len(it) if files is None else len(files))
         if show_progress:
             try:
                 it = tqdm(it, total=len(it))
@@ -90,11 +92,13 @@ async def linter(
         # TODO: Tagfile
 
     buffer = []
-    for file in progressfn(files, 'Linting', files):
-        try:
-            ln = linter.lint(file.expanduser().resolve().absolute())
-        except Exception as err:
-            log.exception('Failed to lint file: %s', file)
+    results = linter.lint_files(
+        [file.expanduser().resolve().absolute() for file in files],
+        num_jobs=num_jobs)
+    # The results are in the order of the files, which are reported as given instead of resolved
+    for file, (_resolved, ln) in zip(files, progressfn(results, 'Linting', files)):
+        if isinstance(ln, Exception):
+            err = ln
             buffer.append(f'{file} Failed to lint file: {err} ({type(err)})')
             continue
         log.debug('Dumping %s diagnostics in .', len(ln.diagnostics))
@@ -106,4 +110,5 @@ async def linter(
                 format_string=format, diagnosticlevel=diagnosticlevel)
             buffer.extend(messages)
 
+    linter.close()
     print('\n'.join(buffer))
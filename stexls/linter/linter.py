@@ -1,20 +1,66 @@
+import itertools
 import logging
 import re
 from multiprocessing import Pool
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Set
+from time import time
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from ..stex.compiler import Compiler, StexObject
 from ..stex.diagnostics import Diagnostic, DiagnosticSeverity
 from ..stex.linker import Linker
-from ..trefier.models.seq2seq import Seq2SeqModel
 from ..util.workspace import Workspace
 from ..vscode import Location, Position
 
+if TYPE_CHECKING:
+    # Importing the model pulls in tensorflow, which is not needed for linting without the trefier.
+    from ..trefier.models.seq2seq import Seq2SeqModel
+
 log = logging.getLogger(__name__)
 
 __all__ = ['LintingResult', 'Linter']
 
+# Environments in which tokens tagged by the trefier are not reported, because they are already references or definitions
+_TREFIER_IGNORED_ENVIRONMENTS = re.compile(
+    r'[ma]*(Tr|tr|D|d|Dr|dr)ef[ivx]+s?\*?|gimport\*?|(import|use)(mh)?module\*?|(sym|var)def\*?|sym[ivx]+\*?|[tv]assign|libinput|\$')
+
+# Linter instance of a worker process of `Linter.lint_files`
+_worker_linter: Optional['Linter'] = None
+
+
+def _init_worker(workspace: Workspace, outdir: Path, trefier_file_size_limit_kb: int, linter_file_size_limit_kb: int):
+    ' Initializes the linter of a worker process once, so that it is not sent along with each task. '
+    global _worker_linter
+    _worker_linter = Linter(
+        workspace,
+        outdir,
+        trefier_file_size_limit_kb=trefier_file_size_limit_kb,
+        linter_file_size_limit_kb=linter_file_size_limit_kb)
+
+
+def _compile_in_worker(args: Tuple[Path, Optional[str], Optional[float]]) -> Optional[StexObject]:
+    ' Compiles or loads the object of a file with the compiler of the worker process. '
+    assert _worker_linter is not None, 'Worker linter not initialized.'
+    return _worker_linter.compiler.compile_or_load_from_file(*args)
+
+
+def _compile_dependencies_in_worker(args: Tuple[Path, Optional[str], Optional[float]]) -> List[Path]:
+    ' Compiles or loads the object of a file like `_compile_in_worker`, but only returns the files it depends on. '
+    obj = _compile_in_worker(args)
+    if obj is None:
+        return []
+    return [dep.file_hint for dep in obj.dependencies]
+
+
+def _lint_in_worker(file: Path) -> Tuple[Path, Union['LintingResult', Exception]]:
+    ' Lints the file using the linter of the worker process and returns either the result or the raised exception. '
+    assert _worker_linter is not None, 'Worker linter not initialized.'
+    try:
+        return file, _worker_linter.lint(file)
+    except Exception as err:
+        log.exception('Failed to lint file: %s', file)
+        return file, err
+
 
 class LintingResult:
     def __init__(self, obj: StexObject):
@@ -91,15 +137,115 @@ class Linter:
         self.workspace = workspace
         self.outdir = outdir or (Path.cwd() / 'objects')
         self.compiler = Compiler(self.workspace.root, self.outdir)
-        self.linker = Linker(self.outdir)
+        # Linked modules are also stored in the outdir, so that other processes and later runs can reuse them
+        self.linker = Linker(self.outdir, cache_dir=self.outdir / 'linked')
         # The objectbuffer stores all compiled objects
         self.unlinked_object_buffer: Dict[Path, StexObject] = dict()
         # The linked object buffer bufferes all linked objects
         self.linked_object_buffer: Dict[Path, StexObject] = dict()
+        # Time before each buffered unlinked object was compiled or loaded.
+        # Buffered objects are valid as long as the file was not modified after this time.
+        self._unlinked_object_buffer_time: Dict[Path, float] = dict()
+        # Reverse indices from a file to the files whose buffered unlinked objects are related to it
+        # or whose buffered linked objects reference symbols defined in it.
+        # Kept up to date whenever one of the buffers is written.
+        self._unlinked_users_of_file: Dict[Path, Set[Path]] = dict()
+        self._linked_users_of_file: Dict[Path, Set[Path]] = dict()
+        # Index of each buffered linked object from the location of a referenced symbol
+        # to the indices of the references that resolve to it.
+        # Created lazily by `references` and discarded whenever the linked object is replaced.
+        self._linked_references_index: Dict[Path, Dict[Location, List[int]]] = dict()
+        # Result of the last lint of each file, together with the unlinked objects it was linked from
+        # and whether the trefier was applied. Linting the same objects again yields the same result.
+        self._lint_cache: Dict[Path, Tuple[Dict[Path, StexObject], bool, LintingResult]] = dict()
         # Maximum file size that the trefier is applied to
         self.trefier_file_size_limit_kb = trefier_file_size_limit_kb
         # Maximum file size the linter is allowed to lint
         self.linter_file_size_limit_kb = linter_file_size_limit_kb
+        # Worker pool used by `compile_workspace`. Created lazily and reused, so that
+        # consecutive calls don't pay for spawning the worker processes again.
+        # Callers that stop compiling the workspace should release it with `close`.
+        self._pool: Optional[Pool] = None
+        self._pool_size: int = 0
+
+    def _get_pool(self, num_jobs: int) -> Pool:
+        ' Returns the persistent worker pool. The pool is recreated if the number of requested jobs changed. '
+        if self._pool is None or self._pool_size != num_jobs:
+            self.close()
+            self._pool = Pool(
+                num_jobs,
+                initializer=_init_worker,
+                initargs=(
+                    self.workspace,
+                    self.outdir,
+                    self.trefier_file_size_limit_kb,
+                    self.linter_file_size_limit_kb))
+            self._pool_size = num_jobs
+        return self._pool
+
+    def close(self):
+        ' Terminates the worker pool if one was created. '
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pool_size = 0
+
+    @staticmethod
+    def _update_users_index(
+            index: Dict[Path, Set[Path]],
+            user: Path,
+            old_used_files: Iterable[Path],
+            new_used_files: Iterable[Path]):
+        ' Moves `user` from the entries of the files it used before to the entries of the files it uses now. '
+        for used_file in set(old_used_files):
+            users = index.get(used_file)
+            if users is not None:
+                users.discard(user)
+                if not users:
+                    del index[used_file]
+        for used_file in new_used_files:
+            index.setdefault(used_file, set()).add(user)
+
+    @staticmethod
+    def _referenced_files(linked: StexObject) -> Iterable[Path]:
+        ' Iterable of files in which the resolved references of a linked object are defined. '
+        for ref in linked.references:
+            for resolved in ref.resolved_symbols:
+                yield resolved.location.path
+
+    def _get_linked_references_index(self, file: Path) -> Dict[Location, List[int]]:
+        ' Index of the buffered linked object of `file` from the location of a referenced symbol to the indices of the references to it. '
+        index = self._linked_references_index.get(file)
+        if index is None:
+            index = dict()
+            for i, ref in enumerate(self.linked_object_buffer[file].references):
+                for location in set(symbol.location for symbol in ref.resolved_symbols):
+                    index.setdefault(location, []).append(i)
+            self._linked_references_index[file] = index
+        return index
+
+    def _buffer_unlinked_object(self, file: Path, obj: StexObject, time_loaded: float):
+        ' Stores the unlinked object in the buffer and updates the reverse index. '
+        previous = self.unlinked_object_buffer.get(file)
+        self.unlinked_object_buffer[file] = obj
+        self._unlinked_object_buffer_time[file] = time_loaded
+        self._update_users_index(
+            self._unlinked_users_of_file,
+            file,
+            previous.related_files if previous is not None else (),
+            obj.related_files)
+
+    def _buffer_linked_object(self, file: Path, obj: StexObject):
+        ' Stores the linked object in the buffer and updates the reverse index. '
+        previous = self.linked_object_buffer.get(file)
+        self.linked_object_buffer[file] = obj
+        self._linked_references_index.pop(file, None)
+        self._update_users_index(
+            self._linked_users_of_file,
+            file,
+            self._referenced_files(previous) if previous is not None else (),
+            self._referenced_files(obj))
 
     def get_files_that_require_recompilation(self) -> Dict[Path, Optional[str]]:
         ' Filters out the files that need recompilation and returns them together with their buffered content. '
@@ -109,6 +255,21 @@ class Linter:
                 files[file] = self.workspace.read_buffer(file)
         return files
 
+    def _get_buffered_unlinked_object(self, file: Path) -> Optional[StexObject]:
+        ' Returns the buffered unlinked object if neither the file nor the file\'s buffer were modified since it was buffered. '
+        obj = self.unlinked_object_buffer.get(file)
+        if obj is None:
+            return None
+        time_loaded = self._unlinked_object_buffer_time[file]
+        if time_loaded < self.workspace.get_time_buffer_modified(file):
+            return None
+        try:
+            if time_loaded < file.lstat().st_mtime:
+                return None
+        except OSError:
+            return None
+        return obj
+
     def get_objectfile(self, file: Path) -> Optional[StexObject]:
         """ Retrieves the object of `file`.
 
@@ -122,10 +283,14 @@ class Linter:
         Returns:
             Optional[StexObject]: The objectfile for `file`. None if an error occured.
         """
+        buffered = self._get_buffered_unlinked_object(file)
+        if buffered is not None:
+            return buffered
+        content, time_modified = self.workspace.read_buffer_and_time_modified(file)
         return self.compiler.compile_or_load_from_file(
             file,
-            content=self.workspace.read_buffer(file),
-            time_modified=self.workspace.get_time_buffer_modified(file)
+            content=content,
+            time_modified=time_modified
         )
 
     def compile_workspace(self, limit: int = 10000, num_jobs: int = 1) -> List[Path]:
@@ -140,28 +305,33 @@ class Linter:
                 If set to 0, then no files are compiled, while -1 removes the limit.
                 Defaults to 10000.
             num_jobs (int, optional): Number of processes to use for multiprocessing. Defaults to 1.
+                The worker processes are only started if more than one file is compiled
+                and are kept until `close` is called.
 
         Returns:
             List[Path]: Paths to files with objects in the workspace.
         '''
+        self.workspace.refresh_tree()
         files = list(self.workspace.files)
         if limit >= 0:
             files = files[:limit]
-        content = list(map(self.workspace.read_buffer, files))
-        time_modified = list(
-            map(self.workspace.get_time_buffer_modified, files))
-        args = zip(files, content, time_modified)
-        if num_jobs > 1:
-            with Pool(num_jobs) as pool:
-                it: Iterable[Optional[StexObject]] = pool.starmap(
-                    self.compiler.compile_or_load_from_file, args)
+        args = (
+            (file, *self.workspace.read_buffer_and_time_modified(file))
+            for file in files)
+        time_loaded = time()
+        if num_jobs > 1 and len(files) > 1:
+            # Objects are buffered as soon as a worker finishes them instead of after all files are compiled
+            pool = self._get_pool(num_jobs)
+            it: Iterable[Optional[StexObject]] = pool.imap_unordered(
+                _compile_in_worker, args,
+                chunksize=max(1, len(files) // (4 * num_jobs)))
         else:
-            it = map(
-                lambda x: self.compiler.compile_or_load_from_file(*x), args)
+            it = (self.compiler.compile_or_load_from_file(*arg)
+                  for arg in args)
         paths = []
         for obj in filter(None, it):
             paths.append(obj.file)
-            self.unlinked_object_buffer[obj.file] = obj
+            self._buffer_unlinked_object(obj.file, obj, time_loaded)
         return paths
 
     def compile_related(self, file: Path) -> Dict[Path, StexObject]:
@@ -179,21 +349,23 @@ class Linter:
             file = queue.pop()
             if file in visited:
                 continue
-            # TODO: Currently forced to reload every file that is used from disk and overwrite the _object_buffer, this should not be necessary
-            # TODO: Only overwrite files that actually changed
-            # TODO: Only load files that are not already in self._object_buffer
-            obj = self.get_objectfile(file)
-            if obj is None:
-                continue
+            buffered = self._get_buffered_unlinked_object(file)
+            if buffered is not None:
+                obj = buffered
+            else:
+                time_loaded = time()
+                obj = self.get_objectfile(file)
+                if obj is None:
+                    continue
+                self._buffer_unlinked_object(file, obj, time_loaded)
             visited[file] = obj
-            self.unlinked_object_buffer[file] = obj
             for dep in obj.dependencies:
                 if dep.file_hint in visited or dep.file_hint in queue:
                     continue
                 queue.add(dep.file_hint)
         return visited
 
-    def lint(self, file: Path, model: Optional[Seq2SeqModel] = None) -> LintingResult:
+    def lint(self, file: Path, model: Optional['Seq2SeqModel'] = None) -> LintingResult:
         ''' Lint a file.
 
         Parameters:
@@ -202,41 +374,119 @@ class Linter:
         Returns:
             LintingResult: The result of the linting process.
         '''
-        if file.is_file():
-            size = file.stat().st_size // 1024
-            if self.linter_file_size_limit_kb > 0 and self.linter_file_size_limit_kb < size:
-                # Guard linting too large files
-                log.warning(
-                    'Skipping linting of large file of size %iKB: %s', size, str(file))
-                return LintingResult(self.unlinked_object_buffer.get(file, StexObject(file)))
-            objects: Dict[Path, StexObject] = self.compile_related(file=file)
-            ln = self.linker.link(file, objects, self.compiler)
-            if model is None:
-                pass
-            elif self.trefier_file_size_limit_kb > 0 and self.trefier_file_size_limit_kb < size:
-                # Guard trefying too large files
-                log.warning(
-                    'Rejecting to use trefier on large file of size %iKB: "%s"', size, str(file))
-            else:
-                log.debug('Adding trefier tags for file: %s', file)
-                tags, = model.predict(file)
-                env_pattern = re.compile(
-                    r'[ma]*(Tr|tr|D|d|Dr|dr)ef[ivx]+s?\*?|gimport\*?|(import|use)(mh)?module\*?|(sym|var)def\*?|sym[ivx]+\*?|[tv]assign|libinput|\$')
-                for tag in tags:
-                    if not isinstance(tag.label, float) or not 0 <= tag.label <= 1:
-                        loc = Location(file.as_uri(), tag.token.range)
-                        log.warning('Encountered invalid tag value "%s" at %s:%s',
-                                    tag.label, file.as_uri(), tag.token.range)
-                        continue
-                    if round(tag.label) and not any(map(env_pattern.fullmatch, tag.token.envs)):
-                        loc = Location(file.as_uri(), tag.token.range)
-                        log.debug('Tagging %s with %s',
-                                  loc.format_link(), tag.label)
-                        ln.diagnostics.trefier_tag(
-                            tag.token.range, tag.token.lexeme, tag.label)
-            self.linked_object_buffer[file] = ln
-            self.linker.validate_object_references(ln)
-        return LintingResult(ln)
+        if not file.is_file():
+            # The file may have been deleted after the workspace was scanned
+            log.warning('Skipping linting of missing file: %s', str(file))
+            return LintingResult(StexObject(file))
+        size = file.stat().st_size // 1024
+        if self.linter_file_size_limit_kb > 0 and self.linter_file_size_limit_kb < size:
+            # Guard linting too large files
+            log.warning(
+                'Skipping linting of large file of size %iKB: %s', size, str(file))
+            return LintingResult(self.unlinked_object_buffer.get(file, StexObject(file)))
+        objects: Dict[Path, StexObject] = self.compile_related(file=file)
+        cached = self._lint_cache.get(file)
+        if cached is not None and self._is_same_lint(cached, objects, model is not None):
+            log.debug('Reusing lint result of unchanged file: %s', file)
+            return cached[2]
+        ln = self.linker.link(file, objects, self.compiler)
+        if model is not None:
+            self._add_trefier_tags(file, size, ln, model)
+        self.linker.validate_object_references(ln)
+        self._buffer_linked_object(file, ln)
+        result = LintingResult(ln)
+        self._lint_cache[file] = (objects, model is not None, result)
+        return result
+
+    @staticmethod
+    def _is_same_lint(
+            cached: Tuple[Dict[Path, StexObject], bool, LintingResult],
+            objects: Dict[Path, StexObject],
+            trefier: bool) -> bool:
+        ' Returns True if the cached lint was made from the exact same unlinked objects and trefier setting. '
+        cached_objects, cached_trefier, _ = cached
+        return (
+            cached_trefier == trefier
+            and cached_objects.keys() == objects.keys()
+            and all(cached_objects[path] is obj for path, obj in objects.items()))
+
+    def forget_lint_result(self, file: Path):
+        ' Removes the cached lint result of the file, e.g. after it was closed. '
+        self._lint_cache.pop(file, None)
+
+    def _add_trefier_tags(self, file: Path, size: int, linked: StexObject, model: 'Seq2SeqModel'):
+        ''' Adds the tags predicted by the trefier `model` as diagnostics to the linked object of `file`.
+
+        Parameters:
+            file (Path): The linted file.
+            size (int): Size of the file in KB.
+            linked (StexObject): Linked object of the file.
+            model (Seq2SeqModel): Trefier model.
+        '''
+        if self.trefier_file_size_limit_kb > 0 and self.trefier_file_size_limit_kb < size:
+            # Guard trefying too large files
+            log.warning(
+                'Rejecting to use trefier on large file of size %iKB: "%s"', size, str(file))
+            return
+        log.debug('Adding trefier tags for file: %s', file)
+        tags, = model.predict(file)
+        uri = file.as_uri()
+        for tag in tags:
+            if not isinstance(tag.label, float) or not 0 <= tag.label <= 1:
+                log.warning('Encountered invalid tag value "%s" at %s:%s',
+                            tag.label, uri, tag.token.range)
+                continue
+            if round(tag.label) and not any(map(_TREFIER_IGNORED_ENVIRONMENTS.fullmatch, tag.token.envs)):
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('Tagging %s with %s',
+                              Location(uri, tag.token.range).format_link(), tag.label)
+                linked.diagnostics.trefier_tag(
+                    tag.token.range, tag.token.lexeme, tag.label)
+
+    def lint_files(self, files: List[Path], num_jobs: int = 1) -> Iterator[Tuple[Path, Union[LintingResult, Exception]]]:
+        ''' Lints multiple files.
+
+        Linting the files is independent of each other, so that with more than one job
+        the files are linted in the worker processes, each using it's own linter
+        that is initialized with the workspace state at the time the worker pool was created.
+        The trefier is not applied.
+
+        Parameters:
+            files (List[Path]): Files to lint.
+            num_jobs (int, optional): Number of processes to use for multiprocessing. Defaults to 1.
+
+        Returns:
+            Iterator[Tuple[Path, Union[LintingResult, Exception]]]: Iterator of
+                the files and their result or the exception raised while linting them, in input order.
+        '''
+        if num_jobs > 1:
+            pool = self._get_pool(num_jobs)
+            # Compile the files and their dependencies beforehand, so that the workers
+            # do not compile the same dependencies at the same time.
+            visited: Set[Path] = set(files)
+            wave = list(visited)
+            while wave:
+                args = (
+                    (file, *self.workspace.read_buffer_and_time_modified(file))
+                    for file in wave)
+                dependencies = pool.imap_unordered(
+                    _compile_dependencies_in_worker, args,
+                    chunksize=max(1, len(wave) // (4 * num_jobs)))
+                wave = []
+                for dependency in itertools.chain.from_iterable(dependencies):
+                    if dependency not in visited:
+                        visited.add(dependency)
+                        wave.append(dependency)
+            yield from pool.imap(
+                _lint_in_worker, files,
+                chunksize=max(1, len(files) // (4 * num_jobs)))
+            return
+        for file in files:
+            try:
+                yield file, self.lint(file)
+            except Exception as err:
+                log.exception('Failed to lint file: %s', file)
+                yield file, err
 
     def find_users_of_file(self, file: Path) -> Set[Path]:
         """ Find all files that use symbols in from `file`.
@@ -247,18 +497,11 @@ class Linter:
         Returns:
             Set[Path]: A set of paths that contain objects that reference `file`.
         """
-        dependent_files_set = set()
-        for obj in self.unlinked_object_buffer.values():
-            if file in obj.related_files:
-                dependent_files_set.add(obj.file)
-            elif obj.file in self.linked_object_buffer:
-                obj = self.linked_object_buffer[obj.file]
-                for ref in obj.references:
-                    if any(resolved.location.path == file for resolved in ref.resolved_symbols):
-                        dependent_files_set.add(obj.file)
-                        break
-        if file in dependent_files_set:
-            dependent_files_set.remove(file)
+        dependent_files_set = set(self._unlinked_users_of_file.get(file, ()))
+        for user in self._linked_users_of_file.get(file, ()):
+            if user in self.unlinked_object_buffer:
+                dependent_files_set.add(user)
+        dependent_files_set.discard(file)
         return dependent_files_set
 
     def definitions(self, file: Path, position: Position) -> List[Location]:
@@ -292,14 +535,22 @@ class Linter:
             return []
         definition_locations = set(
             definition.location for definition in obj.get_definitions_at(position))
+        # Only the linked objects that reference symbols defined in the files
+        # of the definitions can contain references to them
+        users: Set[Path] = set()
+        for location in definition_locations:
+            users.update(self._linked_users_of_file.get(location.path, ()))
 
         references: List[Location] = []
-        for obj in self.linked_object_buffer.values():
-            for ref in obj.references:
-                for refsymb in ref.resolved_symbols:
-                    if refsymb.location in definition_locations:
-                        references.append(
-                            Location(obj.file.as_uri(), ref.range))
-                        break
+        for user in sorted(users):
+            obj = self.linked_object_buffer[user]
+            index = self._get_linked_references_index(user)
+            # Indices of the references that resolve to any of the definitions, each only once and in order
+            indices: Set[int] = set()
+            for location in definition_locations:
+                indices.update(index.get(location, ()))
+            uri = obj.file.as_uri()
+            for i in sorted(indices):
+                references.append(Location(uri, obj.references[i].range))
 
         return references + list(definition_locations)
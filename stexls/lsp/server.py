@@ -1,32 +1,65 @@
 import asyncio
 import datetime
+import itertools
 import logging
+import os
 import sys
 import time
 import uuid
 import zipfile
 from dataclasses import dataclass
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version as package_version
 from pathlib import Path
-from typing import Any, Dict, List, Literal, Optional, Protocol, Set, Union
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Protocol, Sequence, Set, Union
 
-import pkg_resources
 from stexls.util.unwrap import unwrap
 
 from .. import vscode
 from ..jsonrpc.dispatcher import Dispatcher
 from ..jsonrpc.exceptions import InvalidRequestException
 from ..jsonrpc.hooks import alias, method, notification, request
-from ..linter.linter import Linter
-from ..trefier.models.seq2seq import Seq2SeqModel
 from ..util.workspace import Workspace
-from .completions import CompletionEngine
 from .exceptions import ServerNotInitializedException
 from .state import ServerState
 from .workspace_symbols import WorkspaceSymbols
 
+if TYPE_CHECKING:
+    # The linter and completion engine are imported in `Server.initialize`, because they pull in the stex compiler.
+    from ..linter.linter import Linter, LintingResult
+    from .completions import CompletionEngine
+    # The model is imported lazily in `Server.load_trefier_model`, because it pulls in tensorflow.
+    from ..trefier.models.seq2seq import Seq2SeqModel
+
 log = logging.getLogger(__name__)
 
+# Maximum number of queued files for which the trefier predictions are made in a single batch
+_TREFIER_BATCH_SIZE = 16
+
+# Maximum number of low priority files that are linted with a single executor call
+_LINT_BATCH_SIZE = 8
+
+# Capabilities sent in response to `initialize`. The same for every session: Must not be modified.
+_SERVER_CAPABILITIES = {
+    'textDocumentSync': {
+        'openClose': True,
+        'change': 2,  # full=1, incremental=2
+        'save': True,
+    },
+    'completionProvider': {
+        'triggerCharacters': ['?', '[', '{', ',', '='],
+        'allCommitCharacters': [']', '}', ','],
+    },
+    'definitionProvider': True,
+    'referencesProvider': True,
+    'workspace': {
+        'workspaceFolders': {
+            'supported': True,
+            'changeNotifications': True
+        }
+    }
+}
+
 
 class Cancelable(Protocol):
     def cancel(self) -> bool:
@@ -43,7 +76,8 @@ class InitializationOptions:
     compile_workspace_on_startup_file_limit: int = 0
     enable_trefier: Literal['disabled', 'enabled', 'full'] = 'disabled'
     enable_linting_of_related_files: bool = False
-    num_jobs: int = 1
+    # Number of processes used to compile the workspace. Zero or less uses all but one cpu.
+    num_jobs: int = 0
     delay: float = 1
     trefier_download_link: str = ''
     trefier_file_size_limit_kb: int = 50
@@ -57,7 +91,7 @@ class InitializationOptions:
             enable_trefier=obj["enableTrefier"],
             enable_linting_of_related_files=bool(
                 obj['enableLintingOfRelatedFiles']),
-            num_jobs=int(obj['numJobs']),
+            num_jobs=int(obj.get('numJobs', 0)),
             delay=float(obj['delay']),
             trefier_download_link=str(obj.get('trefierDownloadLink', '')),
             trefier_file_size_limit_kb=int(
@@ -66,6 +100,12 @@ class InitializationOptions:
                 obj.get('linterFileSizeLimitKB', 100)),
         )
 
+    def get_num_jobs(self) -> int:
+        ' Returns the number of processes to use, with all but one cpu if `num_jobs` is zero or less. '
+        if self.num_jobs > 0:
+            return self.num_jobs
+        return max(1, (os.cpu_count() or 1) - 1)
+
 
 class Server(Dispatcher):
     def __init__(self, connection):
@@ -77,9 +117,8 @@ class Server(Dispatcher):
         super().__init__(connection=connection)
         # Version
         try:
-            self.version: Optional[str] = str(
-                pkg_resources.require('stexls')[0].version)
-        except Exception:
+            self.version: Optional[str] = package_version('stexls')
+        except PackageNotFoundError:
             self.version = None
         # Initialization options from `initialize` request
         self.initialization_options = InitializationOptions()
@@ -90,13 +129,13 @@ class Server(Dispatcher):
         # Path to the root directory
         self.root_directory: Optional[Path] = None
         # trefier model loaded from path_to_trefier_model
-        self.trefier_model: Optional[Seq2SeqModel] = None
+        self.trefier_model: Optional['Seq2SeqModel'] = None
         # Workspace instance, used to keep track of file buffers
         self.workspace: Optional[Workspace] = None
         # Linter instance, used to create diagnostics
-        self.linter: Optional[Linter] = None
+        self.linter: Optional['Linter'] = None
         # Completion engine used to encapsulate the complex process of creating completion suggestions
-        self.completion_engine: Optional[CompletionEngine] = None
+        self.completion_engine: Optional['CompletionEngine'] = None
         # Manager for work done progress bars
         self.cancellable_work_done_progresses: Dict[object, Cancelable] = {}
         # Accumulator for symbols in workspace, used for suggestions and fast search of missing modules etc
@@ -167,7 +206,7 @@ class Server(Dispatcher):
                  self.work_done_progress_capability)
 
         if isinstance(rootUri, vscode.DocumentUri):
-            self.root_directory = Path(urlparse(rootUri).path)
+            self.root_directory = vscode.uri_to_path(rootUri)
         elif isinstance(rootPath, str):
             # rootPath is deprecated and must only be used if `rootUri` is not defined
             self.root_directory = Path(rootPath)
@@ -175,6 +214,8 @@ class Server(Dispatcher):
             raise RuntimeError('No root path in initialize.')
         log.info('root at: %s', self.root_directory)
         outdir = self.root_directory / '.stexls' / 'objects'
+        from ..linter.linter import Linter
+        from .completions import CompletionEngine
         self.workspace = Workspace(
             self.root_directory, ignorefile=Path('.stexlsignore'))
         if self.initialization_options.enable_trefier != 'disabled':
@@ -198,25 +239,7 @@ class Server(Dispatcher):
             enable_trefier=self.initialization_options.enable_trefier)
         self.state = ServerState.INITIALIZED
         return {
-            'capabilities': {
-                'textDocumentSync': {
-                    'openClose': True,
-                    'change': 1,  # TODO: full=1, incremental=2
-                    'save': True,
-                },
-                'completionProvider': {
-                    'triggerCharacters': ['?', '[', '{', ',', '='],
-                    'allCommitCharacters': [']', '}', ','],
-                },
-                'definitionProvider': True,
-                'referencesProvider': True,
-                'workspace': {
-                    'workspaceFolders': {
-                        'supported': True,
-                        'changeNotifications': True
-                    }
-                }
-            },
+            'capabilities': _SERVER_CAPABILITIES,
             'serverInfo': {
                 'name': 'stexls',
                 'version': self.version
@@ -247,7 +270,7 @@ class Server(Dispatcher):
                          download_path.is_file())
                 model_path = download_path.rename(
                     _get_default_trefier_model_path())
-            self.trefier_model: Seq2SeqModel = Seq2SeqModel.load(model_path)
+            self.trefier_model = Seq2SeqModel.load(model_path)
         except ImportError:
             log.exception('Failed to import seq2seq model dependencies.')
             self.show_message(
@@ -293,8 +316,20 @@ class Server(Dispatcher):
                     cancellable=False,
                     enabled=self.work_done_progress_capability) as progress_bar:
                 await progress_bar.begin()
-                compiled_files = self.linter.compile_workspace(
-                    limit_is, self.initialization_options.num_jobs)
+                # Compile in a thread, so that requests can be handled while the workspace compiles.
+                # The scheduler's lock keeps it from linting until the objects are buffered.
+                loop = asyncio.get_running_loop()
+                num_jobs = self.initialization_options.get_num_jobs()
+
+                def compile_workspace() -> List[Path]:
+                    try:
+                        return self.linter.compile_workspace(limit_is, num_jobs)
+                    finally:
+                        # The workspace is only compiled once, so the worker processes are not needed anymore
+                        self.linter.close()
+                async with unwrap(self.scheduler).lock:
+                    compiled_files = await loop.run_in_executor(
+                        None, compile_workspace)
                 # Sort the file in ascending order -> Add the newest file list -> Will be the file first linted.
                 sorted_compiled_files = sorted(
                     compiled_files, key=self.workspace.get_time_modified)
@@ -309,7 +344,8 @@ class Server(Dispatcher):
     @method
     def shutdown(self):
         log.info('Shutting down server...')
-        # TODO: Do stuff on shutdown?
+        if self.linter is not None:
+            self.linter.close()
 
     @method
     def exit(self):
@@ -356,7 +392,8 @@ class Server(Dispatcher):
                                  vscode.Undefined] = vscode.undefined,
             **params):
         self.protect_from_uninit_and_shutdown()
-        log.debug('definitions(%s, %s)', textDocument.path, position.format())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('definitions(%s, %s)', textDocument.path, position.format())
         definitions = unwrap(self.linter).definitions(
             textDocument.path, position)
         log.debug('Found %i definitions: %s', len(definitions), definitions)
@@ -371,7 +408,8 @@ class Server(Dispatcher):
             context: Any = vscode.undefined,
             **params):
         self.protect_from_uninit_and_shutdown()
-        log.debug('references(%s, %s)', textDocument.path, position.format())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('references(%s, %s)', textDocument.path, position.format())
         references = unwrap(self.linter).references(
             textDocument.path, position)
         log.debug('Found %i references: %s', len(references), references)
@@ -387,8 +425,9 @@ class Server(Dispatcher):
                            vscode.Undefined] = vscode.undefined,
             **kwargs):
         self.protect_from_uninit_and_shutdown()
-        log.debug('completion(%s, %s, context=%s)',
-                  textDocument.path, position.format(), context)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('completion(%s, %s, context=%s)',
+                      textDocument.path, position.format(), context)
         return []
 
     @notification
@@ -400,6 +439,8 @@ class Server(Dispatcher):
     @alias('textDocument/didOpen')
     async def text_document_did_open(self, textDocument: vscode.TextDocumentItem):
         self.protect_from_uninit_and_shutdown()
+        # The file may be new: Rescan the files of the workspace
+        unwrap(self.workspace).refresh_tree()
         did_open = unwrap(self.workspace).open_file(
             textDocument.path, textDocument.version, textDocument.text)
         log.debug('didOpen(%s) -> %s', textDocument, did_open)
@@ -418,13 +459,25 @@ class Server(Dispatcher):
         if not self.workspace:
             return
         if self.workspace.is_open(textDocument.path):
-            for item in contentChanges:
-                status = self.workspace.update_file(
-                    # TODO: `item` has to be properly deserialized !
-                    # TODO: Implement recursive annotations module
-                    textDocument.path, textDocument.version, item['text'])  # type: ignore
+            # TODO: Implement recursive annotations module, so that `contentChanges` is deserialized automatically
+            changes = [
+                vscode.TextDocumentContentChangeEvent.from_json(item)  # type: ignore
+                for item in contentChanges
+            ]
+            # Changes are synchronized incrementally (textDocumentSync.change = 2):
+            # Changes without range contain the whole document, which overwrites all changes before it.
+            first = max(
+                (i for i, change in enumerate(changes) if not change.range), default=0)
+            for change in changes[first:]:
+                if isinstance(change.range, vscode.Range):
+                    status = self.workspace.patch_file(
+                        textDocument.path, textDocument.version, change.range, change.text)
+                else:
+                    status = self.workspace.update_file(
+                        textDocument.path, textDocument.version, change.text)
                 if not status:
-                    log.warning('Failed to patch file with: %s', item)
+                    log.warning('Failed to patch file with: %s', change)
+                    break
         else:
             log.warning(
                 'didChange event for non-opened document: "%s"', textDocument.path)
@@ -437,6 +490,8 @@ class Server(Dispatcher):
         if not self.workspace:
             return
         status = self.workspace.close_file(textDocument.path)
+        if self.linter:
+            self.linter.forget_lint_result(textDocument.path)
         if not status:
             log.warning('Failed to close file: "%s"', textDocument.path)
 
@@ -447,6 +502,8 @@ class Server(Dispatcher):
             textDocument: vscode.TextDocumentIdentifier,
             text: Union[str, vscode.Undefined] = vscode.undefined):
         self.protect_from_uninit_and_shutdown()
+        # The file may have been saved as a new file: Rescan the files of the workspace
+        unwrap(self.workspace).refresh_tree()
         if unwrap(self.workspace).is_open(textDocument.path):
             log.info('didSave: %s', textDocument.uri)
             if not unwrap(self.scheduler).schedule(textDocument.path, prio='high'):
@@ -614,9 +671,9 @@ class LintingScheduler:
         self,
         server: Server,
         delay: float,
-        linter: Linter,
+        linter: 'Linter',
         workspace: Workspace,
-        trefier: Optional[Seq2SeqModel],
+        trefier: Optional['Seq2SeqModel'],
         enable_trefier: Literal['disabled', 'enabled', 'full'],
     ) -> None:
         self.delay = delay
@@ -625,11 +682,18 @@ class LintingScheduler:
         self.workspace = workspace
         self.trefier = trefier
         self.enable_trefier = enable_trefier
-        self.lint_queue_high: List[Path] = []
-        self.lint_queue_low: List[Path] = []
+        # The queues are insertion ordered dicts used as ordered sets:
+        # The next file to lint is the last one that was inserted.
+        self.lint_queue_high: Dict[Path, None] = {}
+        self.lint_queue_low: Dict[Path, None] = {}
         self.task: Optional[Cancelable] = None
         self.timeout: Optional[asyncio.TimerHandle] = None
         self.never_linted_files: Set[Path] = set()
+        # Held while the linter is used by a thread
+        self.lock = asyncio.Lock()
+        # Last result published for each file. The linter returns the same result again
+        # if nothing the file depends on changed, which does not need to be published again.
+        self._published: Dict[Path, 'LintingResult'] = {}
 
     async def _handle_high_priority(self) -> bool:
         """ Lint a file from the high priority queue.
@@ -641,7 +705,11 @@ class LintingScheduler:
         """
         if not self.lint_queue_high:
             return False
-        file = self.lint_queue_high.pop()
+        await self._predict_batch(self.lint_queue_high, self.trefier)
+        if not self.lint_queue_high:
+            # The queue was changed while the predictions were made
+            return False
+        file, _ = self.lint_queue_high.popitem()
         log.debug('Linting high prio: %s', file)
         await self.lint(file, trefier=self.trefier)
         return True
@@ -656,15 +724,52 @@ class LintingScheduler:
         """
         if not self.lint_queue_low:
             return False
-        file = self.lint_queue_low.pop()
-        log.debug('Linting low prio: %s', file)
         trefier = None
         if self.enable_trefier == 'full':
             # Enable trefier, if "full" mode
             trefier = self.trefier
-        await self.lint(file, trefier=trefier)
+        await self._predict_batch(self.lint_queue_low, trefier)
+        if not self.lint_queue_low:
+            # The queue was changed while the predictions were made
+            return False
+        # Low priority files are linted in batches, so that many queued files (workspace
+        # compilation, users of a saved file) are linted and published with few thread switches.
+        # High priority files are still handled between the batches.
+        files = [
+            self.lint_queue_low.popitem()[0]
+            for _ in range(min(_LINT_BATCH_SIZE, len(self.lint_queue_low)))
+        ]
+        log.debug('Linting low prio: %s', files)
+        await self.lint(*files, trefier=trefier)
         return True
 
+    async def _predict_batch(self, queue: Dict[Path, None], trefier: Optional['Seq2SeqModel']):
+        """ Makes the trefier predictions for the next files in the queue in a single batch.
+
+        The model caches its predictions, so that linting the files
+        afterwards does not need to run the model for each file separately.
+
+        Args:
+            queue (Dict[Path, None]): Queue of files about to be linted. The next file is the last one.
+            trefier (Optional[Seq2SeqModel]): Trefier used for linting the files. Nothing is done if None.
+        """
+        if trefier is None or len(queue) < 2:
+            return
+        limit_kb = self.linter.trefier_file_size_limit_kb
+        files = [
+            file
+            for file in itertools.islice(reversed(queue), _TREFIER_BATCH_SIZE)
+            if file.is_file() and (limit_kb <= 0 or file.stat().st_size // 1024 <= limit_kb)
+        ]
+        if len(files) < 2:
+            return
+        log.debug('Predicting trefier tags for %i queued files.', len(files))
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, lambda: trefier.predict(*files))
+        except Exception:
+            log.exception('Failed to predict trefier tags for queued files.')
+
     async def _handle_unbuffered(self, files: List[Path]) -> bool:
         """ Search for a file that is not buffered by the linter and buffer it.
 
@@ -683,7 +788,7 @@ class LintingScheduler:
         # If there is a file that is not buffered,
         # Compile it and buffer the result.
         log.debug('Lint unbuffered object: %s', unbuffered_file)
-        await self.lint(unbuffered_file, None)
+        await self.lint(unbuffered_file, trefier=None)
         return True
 
     async def loop(self):
@@ -725,7 +830,7 @@ class LintingScheduler:
                         await pbar.update(message=f'{items_left if items_left else "?"} files (eta {str(eta)})')
                         last_update_time = time.time()
                     log.debug('Scheduler loop time: %s (%s), eta %s',
-                              loop_time_elapsed, time_elapsed, str(eta))
+                              loop_time_elapsed, time_elapsed, eta)
                     loop_time = time.time()
                     if await self._handle_high_priority():
                         # Continue the loop else the priorities would not have any effect
@@ -753,19 +858,46 @@ class LintingScheduler:
             log.debug('Scheduler loop exited in %s seconds',
                       round(time.time() - begin))
 
-    async def lint(self, file: Path, trefier: Optional[Seq2SeqModel]):
+    async def lint(self, *files: Path, trefier: Optional['Seq2SeqModel']):
+        """ Lints the files in a thread and publishes the diagnostics of all of them afterwards.
+
+        Args:
+            files (Path): Files to lint.
+            trefier (Optional[Seq2SeqModel]): Trefier used for linting the files.
+        """
         # Running the linting in a thread makes everything take a bit longer than
         # running it directly, but without it, we would be unable to handle other requests
         # during linting.
-        log.debug('Scheduler linting "%s" in using trefier (%s)',
-                  str(file), trefier)
+        log.debug('Scheduler linting %s using trefier (%s)',
+                  [str(file) for file in files], trefier)
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, self.linter.lint, file, trefier)
-        log.debug('Finished linting file "%s"', file)
-        self.server.workspace_symbols.remove(file)
-        self.server.workspace_symbols.add(result.object)
-        self.server.publish_diagnostics(
-            uri=file.as_uri(), diagnostics=result.diagnostics)
+        async with self.lock:
+            results = await loop.run_in_executor(None, self._lint_files, files, trefier)
+        log.debug('Finished linting files %s', files)
+        for file, result in zip(files, results):
+            if result is None or self._published.get(file) is result:
+                continue
+            self._published[file] = result
+            self.server.workspace_symbols.remove(file)
+            self.server.workspace_symbols.add(result.object)
+            self.server.publish_diagnostics(
+                uri=file.as_uri(), diagnostics=result.diagnostics)
+
+    def _lint_files(self, files: Sequence[Path], trefier: Optional['Seq2SeqModel']) -> List[Optional['LintingResult']]:
+        """ Lints the files one after another.
+
+        Returns:
+            List[Optional[LintingResult]]: The result of each file or None if linting it failed.
+        """
+        results: List[Optional[LintingResult]] = []
+        for file in files:
+            try:
+                results.append(self.linter.lint(file, trefier))
+            except Exception:
+                # Don't let one file discard the results of the other files
+                log.exception('Failed to lint "%s"', file)
+                results.append(None)
+        return results
 
     def schedule(
         self,
@@ -800,23 +932,23 @@ class LintingScheduler:
                 # Add to high priorty
                 # promote if in any other queue already.
                 if file in self.lint_queue_low:
-                    self.lint_queue_low.remove(file)
+                    del self.lint_queue_low[file]
                 elif file in self.lint_queue_high:
                     # Promote to front of high queue if already queued
-                    self.lint_queue_high.remove(file)
+                    del self.lint_queue_high[file]
                 else:
                     success = True
-            self.lint_queue_high.extend(files)
+            self.lint_queue_high.update(dict.fromkeys(files))
         else:
             for file in files:
                 # Add to low priority.
                 # Promote to front of queue by removing it first if it already
                 # was added to this queue
                 if file in self.lint_queue_low:
-                    self.lint_queue_low.remove(file)
+                    del self.lint_queue_low[file]
                 else:
                     success = True
-            self.lint_queue_low.extend(files)
+            self.lint_queue_low.update(dict.fromkeys(files))
         log.debug('Scheduled %i files with %s priority: %s',
                   len(files), prio, files)
         # Check if there is a task that handles the queued items.
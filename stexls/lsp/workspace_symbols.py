@@ -1,7 +1,10 @@
+from __future__ import annotations
+
 from pathlib import Path
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List
 
-from ..stex.compiler import StexObject
+if TYPE_CHECKING:
+    from ..stex.compiler import StexObject
 
 
 class WorkspaceSymbols:
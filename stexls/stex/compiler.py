@@ -18,15 +18,25 @@ from __future__ import annotations
 import datetime
 import difflib
 import functools
+import itertools
 import logging
+import os
 import pickle
-from hashlib import sha1
+from hashlib import blake2b, sha1
 from pathlib import Path
+from stat import S_ISREG
 from time import time
-from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from packaging.version import parse as parse_version
 
+try:
+    from rapidfuzz import fuzz as rapidfuzz_fuzz
+    from rapidfuzz import process as rapidfuzz_process
+except ImportError:
+    rapidfuzz_fuzz = None
+    rapidfuzz_process = None
+
 from .. import vscode
 from . import exceptions, parser, references, symbols, util
 from .dependency import Dependency
@@ -52,6 +62,56 @@ class ObjectfileIsCorruptedError(Exception):
     pass
 
 
+@functools.lru_cache(maxsize=4096)
+def _objectfile_directory_name(directory: Path) -> str:
+    ' Name of the directory the objectfiles of the sourcefiles in `directory` are stored in. Cached because all files of a directory share it. '
+    return sha1(directory.as_posix().encode()).hexdigest()
+
+
+def _get_close_matches(word: str, possibilities: Iterable[str], n: int = 3, cutoff: float = 0.6) -> List[str]:
+    ''' Same as `difflib.get_close_matches`, but discards most candidates using rapidfuzz first if it is installed.
+
+    The ratio of rapidfuzz is based on the longest common subsequence and therefore never lower
+    than the ratio of difflib. Only candidates that can't reach the cutoff are discarded, so the result is the same.
+    The strings are compared unprocessed, because older rapidfuzz versions strip and lowercase them by default.
+    '''
+    if rapidfuzz_process is not None:
+        possibilities = [
+            choice
+            for choice, _score, _index in rapidfuzz_process.extract(
+                word, list(possibilities), scorer=rapidfuzz_fuzz.ratio,
+                processor=None, score_cutoff=cutoff * 100 - 1e-6, limit=None)
+        ]
+    return difflib.get_close_matches(word, possibilities, n, cutoff)
+
+
+def _read_source(file: Path) -> Optional[str]:
+    ''' Reads a sourcefile like the latex parser does, so that the content can be both hashed and parsed.
+
+    Returns:
+        The content or None if the file can't be read or decoded. The error is then reported by compiling it.
+    '''
+    try:
+        with open(file, encoding='utf-8') as fd:
+            return fd.read()
+    except (OSError, UnicodeError):
+        return None
+
+
+def _hash_content(file: Path, content: Optional[str] = None) -> str:
+    ''' Computes the digest used to detect if the source of an object changed.
+
+    Parameters:
+        file: Path to the sourcefile. Read from disk if `content` is None.
+        content: Buffered content of the file.
+
+    Returns:
+        Hex digest of the content.
+    '''
+    data = file.read_bytes() if content is None else content.encode()
+    return blake2b(data, digest_size=16).hexdigest()
+
+
 class StexObject:
     """ Stex objects contain all the local information about dependencies, symbols and references in one file,
     as well as a list of errors that occured during parsing and compiling.
@@ -79,6 +139,8 @@ class StexObject:
         self.diagnostics: Diagnostics = Diagnostics()
         # Stores creation time
         self.creation_time = time()
+        # Digest of the source this object was compiled from
+        self.content_hash: Optional[str] = None
 
     def get_namespace_at(self, position: vscode.Position) -> List[symbols.Symbol]:
         """ Returns the breadcrumbs list that contains the namespaces the position is located at.
@@ -110,12 +172,12 @@ class StexObject:
         definitions: List[symbols.Symbol] = []
         # First step: Gather the symbol definitions which are directly positioned under the cursor
         for symbol in self.symbol_table.flat():
-            # same file check
-            if symbol.location.path != self.file:
-                continue
             # ignore non-module and non-def symbols (e.g. scopes)
             if not isinstance(symbol, (symbols.ModuleSymbol, symbols.DefSymbol)):
                 continue
+            # same file check
+            if symbol.location.path != self.file:
+                continue
             # Add the symbol if the symbol is positioned under cursor
             if symbol.location.range.contains(position):
                 definitions.append(symbol)
@@ -151,76 +213,94 @@ class StexObject:
 
     @property
     def related_files(self) -> Iterable[Path]:
-        ' Iterable of all files that are somehow referenced inside this object. '
+        ' Iterable of all files that are somehow referenced inside this object. Each file is yielded once. '
+        seen: Set[Path] = set()
         for dep in self.dependencies:
-            yield dep.file_hint
+            if dep.file_hint not in seen:
+                seen.add(dep.file_hint)
+                yield dep.file_hint
         for symbol in self.symbol_table.flat():
-            yield symbol.location.path
+            path = symbol.location.path
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+    def qualified_symbol_names(self) -> List[Tuple[str, symbols.Symbol]]:
+        ''' Lists all symbols in the symbol table together with their qualified name joined by "?".
+
+        The list can be reused by `find_similar_symbols` as long as the symbol table doesn't change.
+        '''
+        return [
+            ('?'.join(symbol.qualified), symbol)
+            for symbol in itertools.chain((self.symbol_table,), self.symbol_table.flat())
+        ]
 
     def find_similar_symbols(
             self,
             scope: symbols.Symbol,
             qualified: Iterable[str],
-            ref_type: ReferenceType) -> Dict[str, Set[Tuple[Optional[ReferenceType], vscode.Location]]]:
+            ref_type: ReferenceType,
+            qualified_symbol_names: Optional[List[Tuple[str, symbols.Symbol]]] = None) -> Dict[str, Set[Tuple[Optional[ReferenceType], vscode.Location]]]:
         ''' Find simlar symbols with reference to a qualified name and an expected symbol type.
 
         Parameters:
             qualified: Qualified identifier of the input symbol.
             ref_type: Expected type of symbol the id should resolve into
+            qualified_symbol_names: Result of `qualified_symbol_names()` if it was already created for a previous call.
 
         Returns:
             Dict[str, Set[symbols.Symbol]]: Dictionary of similar names and the symbols with that name.
         '''
         names: Dict[str, Set[Tuple[Optional[ReferenceType], vscode.Location]]] = {}
-
-        def f(symbol: symbols.Symbol):
+        qualified = tuple(qualified)
+        name = qualified[-1]
+        if qualified_symbol_names is None:
+            qualified_symbol_names = self.qualified_symbol_names()
+        for qualified_name, symbol in qualified_symbol_names:
             # Match similar symbol if reference type is the same
             # But also if the name is an exact match.
             if (ref_type.contains_any_of(symbol.reference_type)
-                    or symbol.name == tuple(qualified)[-1]):
-                names.setdefault('?'.join(symbol.qualified),
-                                 set()).add((symbol.reference_type, symbol.location))
-        self.symbol_table.traverse(lambda s: f(s))
-        close_matches = difflib.get_close_matches('?'.join(qualified), names)
+                    or symbol.name == name):
+                names.setdefault(qualified_name, set()).add(
+                    (symbol.reference_type, symbol.location))
+        close_matches = _get_close_matches('?'.join(qualified), names)
         return {match: names.get(match, set()) for match in close_matches}
 
     def format(self) -> str:
         ' Simple formatter for debugging, that prints out all information in this object. '
-        f = f'\nFile: "{self.file}"'
-        f += f'\nCreation time: {datetime.datetime.fromtimestamp(self.creation_time)}'
-        f += '\nDependencies:'
+        uri = self.file.as_uri()
+        lines = [
+            '',
+            f'File: "{self.file}"',
+            f'Creation time: {datetime.datetime.fromtimestamp(self.creation_time)}',
+            'Dependencies:',
+        ]
         if self.dependencies:
             for dep in self.dependencies:
-                loc = vscode.Location(self.file.as_uri(),
-                                      dep.range).format_link()
-                f += f'\n\t{loc}: {dep.module_name} from "{dep.file_hint}"'
+                loc = vscode.Location(uri, dep.range).format_link()
+                lines.append(f'\t{loc}: {dep.module_name} from "{dep.file_hint}"')
         else:
-            f += '\n\tNo dependencies.'
-        f += '\nReferences:'
+            lines.append('\tNo dependencies.')
+        lines.append('References:')
         if self.references:
             for ref in self.references:
-                loc = vscode.Location(self.file.as_uri(),
-                                      ref.range).format_link()
-                f += f'\n\t{loc}: {"?".join(ref.name)} of type {ref.reference_type}'
+                loc = vscode.Location(uri, ref.range).format_link()
+                lines.append(f'\t{loc}: {"?".join(ref.name)} of type {ref.reference_type}')
         else:
-            f += '\n\tNo references.'
-        f += '\nDiagnostics:'
+            lines.append('\tNo references.')
+        lines.append('Diagnostics:')
         if self.diagnostics:
             for diagnostic in self.diagnostics:
-                link_str = vscode.Location(
-                    self.file.as_uri(), diagnostic.range).format_link()
-                f += f'\n\t{link_str} {diagnostic.severity.name} - {diagnostic.message} ({diagnostic.code})'
+                link_str = vscode.Location(uri, diagnostic.range).format_link()
+                lines.append(
+                    f'\t{link_str} {diagnostic.severity.name} - {diagnostic.message} ({diagnostic.code})')
         else:
-            f += '\n\tNo diagnostics.'
-        f += '\nSymbol Table:'
-        list_of_formatted_strings: List[str] = []
-
-        def enter(formatted_strings: List[str], symbol: symbols.Symbol):
-            formatted_strings.append(f'{"  "*symbol.depth}├ {symbol}')
-        self.symbol_table.traverse(lambda symbol: enter(
-            list_of_formatted_strings, symbol))
-        f += '\n' + '\n'.join(list_of_formatted_strings)
-        return f
+            lines.append('\tNo diagnostics.')
+        lines.append('Symbol Table:')
+        lines.extend(
+            f'{"  "*symbol.depth}├ {symbol}'
+            for symbol in itertools.chain((self.symbol_table,), self.symbol_table.flat()))
+        return '\n'.join(lines)
 
     def add_dependency(self, dep: Dependency):
         """ Registers a dependency that the owner file has to the in the dependency written file and module.
@@ -347,8 +427,7 @@ class Compiler:
         Returns:
             Path to the objectfile.
         '''
-        sha = sha1(file.parent.as_posix().encode()).hexdigest()
-        return self.outdir / sha / (file.name + self.objectfile_extension)
+        return self.outdir / _objectfile_directory_name(file.parent) / (file.name + self.objectfile_extension)
 
     def load_from_objectfile(self, file: Path) -> StexObject:
         ''' Loads the cached objectfile for <file> if it exists.
@@ -364,13 +443,17 @@ class Compiler:
             ObjectfileIsCorruptedError: If the loaded object file can not be deserialized.
         '''
         objectfile = self.get_objectfile_path(file)
-        if not objectfile.is_file():
+        try:
+            # Read the objectfile with a single call instead of letting the unpickler read it frame by frame
+            data = objectfile.read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
             raise ObjectfileNotFoundError(file)
-        with open(objectfile, 'rb') as fd:
-            obj = pickle.load(fd)
-            if not isinstance(obj, StexObject) or obj.file.expanduser().resolve().absolute() != file.expanduser().resolve().absolute():
-                raise ObjectfileIsCorruptedError(file)
-            return obj
+        obj = pickle.loads(data)
+        if not isinstance(obj, StexObject):
+            raise ObjectfileIsCorruptedError(file)
+        if obj.file != file and obj.file.expanduser().resolve().absolute() != file.expanduser().resolve().absolute():
+            raise ObjectfileIsCorruptedError(file)
+        return obj
 
     def recompilation_required(self, file: Path, time_modified: float = None):
         ''' Tests if compilation required by checking if the objectfile is up to date.
@@ -383,9 +466,14 @@ class Compiler:
             Returns true if the file wasnt compiled yet or if the objectfile is older than the last edit to the file.
         '''
         objectfile = self.get_objectfile_path(file)
-        if not objectfile.is_file():
+        try:
+            # A single stat both checks that the objectfile exists and gets the time it was compiled
+            objectfile_stat = objectfile.stat()
+        except OSError:
+            return True
+        if not S_ISREG(objectfile_stat.st_mode):
             return True
-        time_compiled = objectfile.lstat().st_mtime
+        time_compiled = objectfile_stat.st_mtime
         if time_modified and time_compiled < time_modified:
             return True
         if time_compiled < file.lstat().st_mtime:
@@ -417,9 +505,14 @@ class Compiler:
         if not file.is_file():
             raise FileNotFoundError(file)
         objectfile = self.get_objectfile_path(file)
-        objectdir = objectfile.parent
-        objectdir.mkdir(parents=True, exist_ok=True)
         object = StexObject(file)
+        if content is None:
+            # Read the file only once for hashing and parsing
+            content = _read_source(file)
+        try:
+            object.content_hash = _hash_content(file, content)
+        except OSError:
+            log.exception('Failed to hash content of "%s".', file)
         intermed_parser = parser.IntermediateParser(file)
         intermed_parser.parse(content)
         for loc, errors in intermed_parser.errors.items():
@@ -428,13 +521,24 @@ class Compiler:
         for root in intermed_parser.roots:
             context: List[Tuple[Optional[parser.IntermediateParseTree], symbols.Symbol]] = [
                 (None, object.symbol_table)]
-            enter = functools.partial(self._compile_enter, object, context)
-            exit = functools.partial(self._compile_exit, object, context)
-            root.traverse(enter, exit)
+            root.traverse(
+                lambda tree: self._compile_enter(object, context, tree),
+                lambda tree: self._compile_exit(object, context, tree))
         try:
             if not dryrun:
-                with open(objectfile, 'wb') as fd:
-                    pickle.dump(object, fd)
+                objectfile.parent.mkdir(parents=True, exist_ok=True)
+                # Write to a temporary file first and then replace the objectfile,
+                # so that other processes never load a partially written objectfile.
+                tmpfile = objectfile.with_name(
+                    f'{objectfile.name}.{os.getpid()}.tmp')
+                try:
+                    with open(tmpfile, 'wb') as fd:
+                        pickle.dump(object, fd, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmpfile, objectfile)
+                finally:
+                    # Nothing is left behind if writing or replacing failed
+                    if tmpfile.exists():
+                        tmpfile.unlink()
         except Exception:
             # ignore errors if objectfile can't be written to disk
             # and continue as usual
@@ -453,6 +557,8 @@ class Compiler:
 
         If the objectfile exists on disk and the target file
         is not newer than it, we load the objectfile.
+        The objectfile is also loaded if the file is newer,
+        but the content is still the same as when it was compiled.
         Else the `content` is used to compile the file.
         If `content` is None the file contents will be loaded
         from disk.
@@ -470,6 +576,12 @@ class Compiler:
         """
         try:
             if self.recompilation_required(file, time_modified):
+                if content is None:
+                    # Read the file only once for the content check and compiling
+                    content = _read_source(file)
+                unchanged = self._load_if_content_unchanged(file, content)
+                if unchanged is not None:
+                    return unchanged
                 return self.compile(file, content)
         except FileNotFoundError:
             # Return None because load_from_objectfile will
@@ -482,6 +594,30 @@ class Compiler:
             pass
         return None
 
+    def _load_if_content_unchanged(self, file: Path, content: Optional[str]) -> Optional[StexObject]:
+        ''' Loads the objectfile of `file` if it was compiled from the same content.
+
+        If the content matches, the objectfile is touched so that it is
+        considered up to date by `recompilation_required` again.
+
+        Parameters:
+            file: Path to source file.
+            content: Buffered content of the file. Read from disk if None.
+
+        Returns:
+            The loaded object or None if the content changed or the object can't be loaded.
+        '''
+        try:
+            obj = self.load_from_objectfile(file)
+            content_hash = getattr(obj, 'content_hash', None)
+            if content_hash is None or content_hash != _hash_content(file, content):
+                return None
+            os.utime(self.get_objectfile_path(file))
+        except (OSError, ObjectfileIsCorruptedError, pickle.UnpicklingError, EOFError):
+            return None
+        log.debug('Content of "%s" unchanged: Skipping recompilation.', file)
+        return obj
+
     def _compile_modsig(self, obj: StexObject, context: symbols.Symbol, modsig: parser.ModsigIntermediateParseTree):
         name_location = modsig.location.replace(
             positionOrRange=modsig.name.range)
@@ -614,8 +750,7 @@ class Compiler:
                 reference_type=ReferenceType.ANY_DEFINITION))
         if trefi.m:
             obj.diagnostics.mtref_deprecated_check(trefi.location.range)
-            has_q = trefi.target_annotation and '?' in trefi.target_annotation.text
-            if not has_q:
+            if trefi.target_symbol is None:
                 obj.diagnostics.mtref_questionmark_syntax_check(
                     trefi.location.range)
 
@@ -714,11 +849,13 @@ class Compiler:
                 importmodule.repos.range)
         # TODO: is-current-dir-check not needed? importmodule{} without any arg --> SAME FILE (not same directory like with gmodule)
         # importmodule[]{} with any arg (mhrepos, path, dir) --> SAME DIRECTORY (if the arg is the same directory) but not same file
-        if importmodule.mhrepos and importmodule.mhrepos.text == util.get_repository_name(self.root_dir, obj.file):
+        same_repository = bool(importmodule.mhrepos) and importmodule.mhrepos.text == util.get_repository_name(
+            self.root_dir, obj.file)
+        if same_repository:
             obj.diagnostics.is_current_dir_check(
                 importmodule.mhrepos.range, importmodule.mhrepos.text)
         # same path/dir is acceptable if it refers to a different repo
-        if not importmodule.mhrepos or importmodule.mhrepos.text == util.get_repository_name(self.root_dir, obj.file):
+        if not importmodule.mhrepos or same_repository:
             if importmodule.path and importmodule.path.text == util.get_path(self.root_dir, obj.file):
                 obj.diagnostics.is_current_dir_check(
                     importmodule.path.range, importmodule.path.text)
@@ -951,6 +1088,25 @@ class Compiler:
 
         return module
 
+    # Compile method of each intermediate parse tree type. None of the types inherit from another,
+    # so that the exact type of a tree is enough to find the method.
+    _COMPILE_ENTER_DISPATCH: Dict[type, Callable[..., Optional[symbols.Symbol]]] = {
+        parser.ScopeIntermediateParseTree: _compile_scope,
+        parser.ModsigIntermediateParseTree: _compile_modsig,
+        parser.ModnlIntermediateParseTree: _compile_modnl,
+        parser.ModuleIntermediateParseTree: _compile_module,
+        parser.TassignIntermediateParseTree: _compile_tassign,
+        parser.TrefiIntermediateParseTree: _compile_trefi,
+        parser.DefiIntermediateParseTree: _compile_defi,
+        parser.SymIntermediateParserTree: _compile_sym,
+        parser.SymdefIntermediateParseTree: _compile_symdef,
+        parser.ImportModuleIntermediateParseTree: _compile_importmodule,
+        parser.GImportIntermediateParseTree: _compile_gimport,
+        parser.GStructureIntermediateParseTree: _compile_gstructure,
+        parser.ViewIntermediateParseTree: _compile_view,
+        parser.ViewSigIntermediateParseTree: _compile_viewsig,
+    }
+
     def _compile_enter(self, obj: StexObject, context: List[Tuple[parser.IntermediateParseTree, symbols.Symbol]], tree: parser.IntermediateParseTree):
         """ This manages the enter operation of the intermediate parse tree into relevant environemnts.
 
@@ -961,39 +1117,9 @@ class Compiler:
         _, current_context = context[-1]
         next_context = None
         try:
-            if isinstance(tree, parser.ScopeIntermediateParseTree):
-                next_context = self._compile_scope(obj, current_context, tree)
-            elif isinstance(tree, parser.ModsigIntermediateParseTree):
-                next_context = self._compile_modsig(obj, current_context, tree)
-            elif isinstance(tree, parser.ModnlIntermediateParseTree):
-                next_context = self._compile_modnl(obj, current_context, tree)
-            elif isinstance(tree, parser.ModuleIntermediateParseTree):
-                next_context = self._compile_module(obj, current_context, tree)
-            elif isinstance(tree, parser.TassignIntermediateParseTree):
-                next_context = self._compile_tassign(
-                    obj, current_context, tree)
-            elif isinstance(tree, parser.TrefiIntermediateParseTree):
-                next_context = self._compile_trefi(obj, current_context, tree)
-            elif isinstance(tree, parser.DefiIntermediateParseTree):
-                next_context = self._compile_defi(obj, current_context, tree)
-            elif isinstance(tree, parser.SymIntermediateParserTree):
-                next_context = self._compile_sym(obj, current_context, tree)
-            elif isinstance(tree, parser.SymdefIntermediateParseTree):
-                next_context = self._compile_symdef(obj, current_context, tree)
-            elif isinstance(tree, parser.ImportModuleIntermediateParseTree):
-                next_context = self._compile_importmodule(
-                    obj, current_context, tree)
-            elif isinstance(tree, parser.GImportIntermediateParseTree):
-                next_context = self._compile_gimport(
-                    obj, current_context, tree)
-            elif isinstance(tree, parser.GStructureIntermediateParseTree):
-                next_context = self._compile_gstructure(
-                    obj, current_context, tree)
-            elif isinstance(tree, parser.ViewIntermediateParseTree):
-                next_context = self._compile_view(obj, current_context, tree)
-            elif isinstance(tree, parser.ViewSigIntermediateParseTree):
-                next_context = self._compile_viewsig(
-                    obj, current_context, tree)
+            compile_tree = self._COMPILE_ENTER_DISPATCH.get(type(tree))
+            if compile_tree is not None:
+                next_context = compile_tree(self, obj, current_context, tree)
         except Exception as err:
             log.critical('An unexpected error happned during compilation.')
             obj.diagnostics.exception(
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import sys
 from pathlib import Path
 
 from .. import vscode
@@ -7,6 +8,12 @@ from . import symbols
 
 
 class Dependency:
+    # Dependencies are created for every import, so they don't carry a __dict__.
+    # The pickled state still is a dict of the attributes, so that objectfiles keep their layout.
+    __slots__ = (
+        'range', 'scope', 'module_name', 'module_type_hint',
+        'file_hint', 'export', 'disable_redundant_import_diagnostic')
+
     def __init__(
             self,
             range: vscode.Range,
@@ -34,12 +41,19 @@ class Dependency:
         """
         self.range = range
         self.scope = scope
-        self.module_name = module_name
+        self.module_name = sys.intern(module_name)
         self.module_type_hint = module_type_hint
         self.file_hint = file_hint
         self.export = export
         self.disable_redundant_import_diagnostic = disable_redundant_import_diagnostic
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def pretty_format(self, file: Path = None):
         ' A simple formatting method for debugging. '
         export = 'public' if self.export else 'private'
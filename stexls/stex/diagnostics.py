@@ -3,8 +3,6 @@ from enum import Enum
 from pathlib import Path
 from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-import numpy as np
-
 from .. import vscode
 from ..util.format import format_enumeration
 from ..vscode import (Diagnostic, DiagnosticRelatedInformation,
@@ -105,9 +103,9 @@ class Diagnostics:
                                 code, relatedInformation=related)
         self.diagnostics.append(diagnostic)
 
-    def trefier_tag(self, range: vscode.Range, text: str, label: np.ndarray):
+    def trefier_tag(self, range: vscode.Range, text: str, label: float):
         ' Create a simple diagnostic for a trefier tag. '
-        message = f'Label for "{text}": {np.round(label, 2)}'
+        message = f'Label for "{text}": {round(label, 2)}'
         severity = DiagnosticSeverity.Information
         code = DiagnosticCodeName.TREFIER_TAG_HINT.name
         # TODO: Diagnostics have a "related information" field, allowing them to display references to possible defis.
@@ -3,9 +3,13 @@
 The idea here is that it mirrors the "ln" command for c++.
 The ln command takes a list of c++ objects and resolves the symbol references inside them.
 """
+import os
+import pickle
+from hashlib import sha1
 from pathlib import Path
 from time import time
-from typing import Dict, Iterable, List, Optional, Tuple, Union
+from typing import (Dict, Generator, Iterable, List, NamedTuple, Optional,
+                    Tuple, Union)
 
 from stexls.stex.reference_type import ReferenceType
 from stexls.stex.references import Reference
@@ -22,6 +26,14 @@ import logging
 log = logging.getLogger(__name__)
 
 
+class _LinkRequest(NamedTuple):
+    ' Dependency that a `Linker._link_steps` generator requires to be linked before it can continue. '
+    file: Path
+    module_name: str
+    toplevel_module: Optional[str]
+    usemodule_on_stack: bool
+
+
 class Linker:
     """
     This linker does the same thing as the "ln", except that the name of the object file is inferred from the name of
@@ -31,15 +43,23 @@ class Linker:
     A "ln dep1.o dep2.o main.o -o a.out" command is the same as "aout = Linker(...).link(main.tex)"
     """
 
-    def __init__(self, compiler_outdir: Union[str, Path]):
+    def __init__(self, compiler_outdir: Union[str, Path], cache_dir: Union[str, Path] = None):
+        """ Initializes the linker.
+
+        Parameters:
+            compiler_outdir: Directory in which the compiler stores the compiled objects.
+            cache_dir: Optional directory in which linked modules are additionally stored,
+                so that other processes and later runs can reuse them.
+        """
         # Directory in which the compiler stores the compiled objects
         self.outdir = Path(compiler_outdir)
-        # Dict[usemodule_on_stack?, [File, [ModuleName, (TimeModified, StexObject)]]]
+        # Directory in which the linked modules of `cache` are persisted or None
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        # Dict[(usemodule_on_stack?, File, ModuleName), (TimeModified, StexObject)]
         # ModuleName is the name of the Module that is guaranteed to be fully linked inside StexObject
         # This means, that the objects linked by calling `link` from the user, will never be cached
         # and will always be linked again.
-        self.cache: Dict[Optional[bool], Dict[Path, Dict[str, Tuple[float, StexObject]]]] = {
-            True: dict(), False: dict()}
+        self.cache: Dict[Tuple[bool, Path, str], Tuple[float, StexObject]] = dict()
 
     def link_dependency(self, obj: StexObject, dependency: Dependency, imported: StexObject):
         ''' Links the module specified in `dependency` from `imported` with `obj` at the scope declared in the
@@ -88,21 +108,74 @@ class Linker:
             file: Union[str, Path],
             objects: Dict[Path, StexObject],
             compiler: Compiler,
-            required_symbol_names: List[str] = None,
-            *,
-            _stack: Dict[Tuple[Path, str],
-                         Tuple[StexObject, Dependency]] = None,
-            _toplevel_module: str = None,
-            _usemodule_on_stack: bool = False) -> StexObject:
+            required_symbol_names: List[str] = None) -> StexObject:
+        """ Links the object of `file` with the objects of it's dependencies.
+
+        Dependencies are linked depth first. Instead of recursing, each object that is currently
+        being linked is represented by a `_link_steps` generator on an explicit stack.
+        The generator yields the dependency it needs linked and is resumed with the linked result.
+
+        Parameters:
+            file: Sourcefile of the object to link.
+            objects: Index of compiled objects which can be used to link the dependencies.
+            compiler: Compiler used to load objectfiles.
+            required_symbol_names: If given, only dependencies of scopes with these names will be linked.
+
+        Returns:
+            The linked object.
+        """
+        # Dependencies (file_hint, module_name) currently being linked: Used to detect cycles
+        on_stack: Dict[Tuple[Path, str], Tuple[StexObject, Dependency]] = {}
+        stack: List[Generator[_LinkRequest, StexObject, StexObject]] = [
+            self._link_steps(Path(file), objects, compiler, required_symbol_names, on_stack, None, False)]
+        result: Optional[StexObject] = None
+        error: Optional[Exception] = None
+        while True:
+            try:
+                if error is None:
+                    request = stack[-1].send(result)  # type: ignore
+                else:
+                    request = stack[-1].throw(error)
+            except StopIteration as stop:
+                stack.pop()
+                if not stack:
+                    return stop.value
+                result, error = stop.value, None
+                continue
+            except Exception as err:
+                # Forward the error to the object that requested the failed link
+                stack.pop()
+                if not stack:
+                    raise
+                result, error = None, err
+                continue
+            file_hint, module_name, toplevel_module, usemodule_on_stack = request
+            stack.append(self._link_steps(
+                file_hint, objects, compiler, [module_name], on_stack, toplevel_module, usemodule_on_stack))
+            result, error = None, None
+
+    def _link_steps(
+            self,
+            path: Path,
+            objects: Dict[Path, StexObject],
+            compiler: Compiler,
+            required_symbol_names: Optional[List[str]],
+            _stack: Dict[Tuple[Path, str], Tuple[StexObject, Dependency]],
+            _toplevel_module: Optional[str],
+            _usemodule_on_stack: bool) -> Generator[_LinkRequest, StexObject, StexObject]:
+        """ Generator that links a single object.
+
+        Yields a `_LinkRequest` for every dependency that needs to be linked first
+        and expects to be sent the linked object of that dependency in return.
+
+        Returns:
+            The linked object of `path`.
+        """
         # load the objectfile
         # The object must be loaded from file because a deep copy (especially of the dependencies) is required
         # load_from_objectfile can raise FileNotFound but this should have been caught even before attempting to link the object
-        path = Path(file)
         obj = compiler.load_from_objectfile(path)
         obj.creation_time = time()
-        # initialize the stack if not already initialized
-        _stack = {} if _stack is None else _stack
-        # Cache initialization is a little bit more complicated
         for dep in obj.dependencies:
             if required_symbol_names and dep.scope.name not in required_symbol_names:
                 continue
@@ -140,14 +213,8 @@ class Linker:
                     # Toplevel used for preventing circular imports
                     _toplevel_module = dep.scope.get_current_module_name()
                 try:
-                    imported = self.link(
-                        objects=objects,
-                        file=dep.file_hint,
-                        compiler=compiler,
-                        required_symbol_names=[dep.module_name],
-                        _stack=_stack,
-                        _toplevel_module=_toplevel_module,
-                        _usemodule_on_stack=update_usemodule_on_stack)
+                    imported = yield _LinkRequest(
+                        dep.file_hint, dep.module_name, _toplevel_module, update_usemodule_on_stack)
                     self._store_linked_in_cache(
                         update_usemodule_on_stack, dep.file_hint, dep.module_name, imported)
                 except (ObjectfileNotFoundError, ObjectfileIsCorruptedError):
@@ -168,7 +235,7 @@ class Linker:
         try:
             mtime, obj = self._load_linked_from_cache(
                 usemodule_on_stack, file, module_name)
-        except ObjectfileNotFoundError:
+        except (ObjectfileNotFoundError, ObjectfileIsCorruptedError):
             # Module not cached -> Linking required
             return True
         if file in compiled_objects and mtime < compiled_objects[file].creation_time:
@@ -176,8 +243,9 @@ class Linker:
             return True
         try:
             # Check whether any file referenced by a dependency or symbol is newer than this link
-            for path in set(obj.related_files):
-                if path in compiled_objects and mtime < compiled_objects[path].creation_time:
+            for path in obj.related_files:
+                compiled = compiled_objects.get(path)
+                if compiled is not None and mtime < compiled.creation_time:
                     # The object of a dependency has been recompiled
                     return True
             return False
@@ -187,17 +255,66 @@ class Linker:
 
     def _load_linked_from_cache(self, usemodule_on_stack: bool, file: Path, module: str) -> Tuple[float, StexObject]:
         ' Return the tuple of (timestamp added, stexobj) from cache or raises ObjectfileNotFound if not cached. '
-        context = self.cache.get(usemodule_on_stack, {})
-        modules = context.get(file, {})
-        linked = modules.get(module)
+        key = (usemodule_on_stack, file, module)
+        linked = self.cache.get(key)
         if linked is None:
-            raise ObjectfileNotFoundError(file)
+            linked = self._load_linked_from_cache_dir(
+                usemodule_on_stack, file, module)
+            self.cache[key] = linked
         return linked
 
     def _store_linked_in_cache(self, usemodule_on_stack: bool, file: Path, module: str, obj: StexObject):
         ' Store an obj in cache. '
-        self.cache[usemodule_on_stack].setdefault(
-            file, {})[module] = (time(), obj)
+        linked = (time(), obj)
+        self.cache[(usemodule_on_stack, file, module)] = linked
+        if self.cache_dir is None:
+            return
+        cachefile = self._get_cachefile_path(usemodule_on_stack, file, module)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Replace the cachefile at once, so that other processes never load a partially written file.
+            tmpfile = cachefile.with_name(f'{cachefile.name}.{os.getpid()}.tmp')
+            try:
+                with open(tmpfile, 'wb') as fd:
+                    pickle.dump(linked, fd, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmpfile, cachefile)
+            finally:
+                # Nothing is left behind if writing or replacing failed
+                if tmpfile.exists():
+                    tmpfile.unlink()
+        except Exception:
+            log.exception('Failed to write linked module "%s" of "%s" to "%s".', module, file, cachefile)
+
+    def _load_linked_from_cache_dir(self, usemodule_on_stack: bool, file: Path, module: str) -> Tuple[float, StexObject]:
+        ''' Loads the tuple of (timestamp added, stexobj) persisted by `_store_linked_in_cache`.
+
+        Whether the loaded module is outdated is checked by `_relink_required` the same way as for modules
+        linked by this process, because the timestamp is the time the module was linked.
+
+        Raises:
+            ObjectfileNotFoundError: If there is no cache directory or the module was not stored in it.
+            ObjectfileIsCorruptedError: If the stored file can't be loaded.
+        '''
+        if self.cache_dir is None:
+            raise ObjectfileNotFoundError(file)
+        cachefile = self._get_cachefile_path(usemodule_on_stack, file, module)
+        try:
+            data = cachefile.read_bytes()
+        except OSError:
+            raise ObjectfileNotFoundError(file)
+        try:
+            mtime, obj = pickle.loads(data)
+        except Exception:
+            raise ObjectfileIsCorruptedError(cachefile)
+        if not isinstance(obj, StexObject) or not isinstance(mtime, float):
+            raise ObjectfileIsCorruptedError(cachefile)
+        return mtime, obj
+
+    def _get_cachefile_path(self, usemodule_on_stack: bool, file: Path, module: str) -> Path:
+        ' Path of the file in `cache_dir` the linked `module` of `file` is stored in. '
+        assert self.cache_dir is not None
+        key = f'{usemodule_on_stack}|{file.as_posix()}|{module}'
+        return self.cache_dir / f'{sha1(key.encode()).hexdigest()}.stexlink'
 
     def validate_object_references(self, linked: StexObject):
         ''' Validate the references inside an object.
@@ -207,6 +324,8 @@ class Linker:
         Parameters:
             linked: The object that needs validation
         '''
+        # Names of the symbols that undefined references are compared to. Created once when the first reference is undefined.
+        qualified_symbol_names: Optional[List[Tuple[str, symbols.Symbol]]] = None
         for ref in linked.references:
             # Check if parent constraint is met
             if isinstance(ref.parent, Dependency):
@@ -220,15 +339,16 @@ class Linker:
                     # skip this reference
                     continue
 
-            refname = "?".join(ref.name)
             # TODO: Does using ref.reference_type to specify the expected type restrict too much?
             resolved: Iterable[symbols.Symbol] = ref.scope.lookup(
                 ref.name, ref.reference_type)
             if not resolved:
+                if qualified_symbol_names is None:
+                    qualified_symbol_names = linked.qualified_symbol_names()
                 similar_symbols = linked.find_similar_symbols(
-                    ref.scope, ref.name, ref.reference_type)
+                    ref.scope, ref.name, ref.reference_type, qualified_symbol_names)
                 linked.diagnostics.undefined_symbol(
-                    ref.range, refname, ref.reference_type, similar_symbols)
+                    ref.range, "?".join(ref.name), ref.reference_type, similar_symbols)
             for symbol in resolved:
                 # TODO: Are these warnings really useful? (currently not matching symbols are filtered out during lookup)
                 # Reasoning: It's okay to have e.g. modules and symbols of the same name so there may exist
@@ -243,8 +363,8 @@ class Linker:
                     defs: symbols.DefSymbol = symbol
                     if defs.noverb:
                         linked.diagnostics.symbol_is_noverb_check(
-                            ref.range, refname, related_symbol_location=symbol.location)
+                            ref.range, "?".join(ref.name), related_symbol_location=symbol.location)
                     binding = defs.get_current_binding()
                     if binding is not None and binding.lang in defs.noverbs:
                         linked.diagnostics.symbol_is_noverb_check(
-                            ref.range, refname, binding.lang, related_symbol_location=symbol.location)
+                            ref.range, "?".join(ref.name), binding.lang, related_symbol_location=symbol.location)
@@ -7,9 +7,11 @@ preparses the contents in order to create an intermediate parse tree.
 """
 from __future__ import annotations
 
+import os
 import re
+import sys
 from pathlib import Path
-from typing import (Any, Callable, Collection, Dict, List, Optional, Sequence,
+from typing import (Any, Callable, Dict, List, Match, Optional, Sequence,
                     Set, Tuple, Union)
 
 from .. import vscode
@@ -153,18 +155,81 @@ class TokenWithLocation:
 
     @staticmethod
     def from_node(node: parser.Node) -> TokenWithLocation:
-        return TokenWithLocation(node.text_inside, node.content_range)
+        return TokenWithLocation(_intern(node.text_inside), node.content_range)
 
     @staticmethod
     def from_node_union(nodes: Sequence[parser.Node], separator: str = ',') -> Optional[TokenWithLocation]:
         # TODO: Can be deleted?
-        tags = list(map(TokenWithLocation.from_node, nodes))
-        ranges: Sequence[vscode.Range] = tuple(
-            token.range for token in tags)
-        range_union = vscode.Range.big_union(ranges)
-        assert range_union is not None, "Node ranges union must exist."
-        text = tuple(token.text for token in tags)
-        return TokenWithLocation(separator.join(text), range_union)
+        assert nodes, "Node ranges union must exist."
+        texts: List[str] = []
+        start: Optional[vscode.Position] = None
+        end: Optional[vscode.Position] = None
+        # Collect the texts and the smallest and largest positions in one pass
+        for node in nodes:
+            texts.append(node.text_inside)
+            content_range = node.content_range
+            if start is None or content_range.start.is_before(start):
+                start = content_range.start
+            if end is None or content_range.end.is_after(end):
+                end = content_range.end
+        assert start is not None and end is not None
+        return TokenWithLocation(separator.join(texts), vscode.Range(start.copy(), end.copy()))
+
+
+# Texts up to this length are interned
+_MAX_INTERNED_LENGTH = 64
+
+
+def _intern(text: str) -> str:
+    ''' Interns short texts like module and symbol names.
+
+    The same names occur over and over in a file, interning them makes equal names share memory,
+    makes comparisons of equal names an identity check and lets pickle store them once per objectfile.
+    '''
+    if len(text) <= _MAX_INTERNED_LENGTH:
+        return sys.intern(text)
+    return text
+
+
+def _resolve(path: str) -> Path:
+    ' Same as Path(path).expanduser().resolve(), but the path is only wrapped in a Path after it is resolved. '
+    return Path(os.path.realpath(os.path.expanduser(path)))
+
+
+# Cache of environment names and the from_environment constructor responsible for them
+# together with the match of the constructor's pattern, or None
+_ENVIRONMENT_CONSTRUCTORS: Dict[str, Optional[Tuple[Callable[[parser.Environment, Match[str]], Any], Match[str]]]] = {}
+
+
+def _get_environment_constructor(env_name: str) -> Optional[Tuple[Callable[[parser.Environment, Match[str]], Any], Match[str]]]:
+    ''' Finds the from_environment constructor of the IntermediateParseTree subclass
+    whose pattern matches the environment name.
+
+    The patterns of the subclasses are disjoint, so at most one constructor is responsible
+    for an environment. Because documents use the same few environment names over and over,
+    the result is cached by name and the patterns are only tried once per name.
+    The match is cached as well and given to the constructor, so that it doesn't need to match the name again.
+
+    Parameters:
+        env_name: Name of the environment.
+
+    Returns:
+        Tuple of the responsible constructor and the match of it's pattern
+        or None if the environment is irrelevant for the intermediate parse tree.
+    '''
+    try:
+        return _ENVIRONMENT_CONSTRUCTORS[env_name]
+    except KeyError:
+        pass
+    constructor = None
+    for cls in IntermediateParseTree.__subclasses__():
+        pattern = getattr(cls, 'PATTERN', None)
+        match = pattern.fullmatch(env_name) if pattern is not None else None
+        if match is not None:
+            constructor = (getattr(cls, 'from_environment'), match)
+            break
+    _ENVIRONMENT_CONSTRUCTORS[env_name] = constructor
+    return constructor
 
 
 class IntermediateParser:
@@ -178,6 +243,8 @@ class IntermediateParser:
         self.roots: List[IntermediateParseTree] = []
         # Buffer for exceptions raised during parsing
         self.errors: Dict[vscode.Location, List[Exception]] = {}
+        # Content of the file the last time it was parsed
+        self.source: Optional[str] = None
 
     def parse(self, content: str = None) -> IntermediateParser:
         ''' Parse the file from the in the constructor given path.
@@ -190,20 +257,19 @@ class IntermediateParser:
         '''
         if self.roots:
             raise ValueError('File already parsed.')
-        subclass_constructors: Tuple[Callable[[parser.Environment], Any], ...] = tuple(
-            getattr(cls, 'from_environment')
-            for cls
-            in IntermediateParseTree.__subclasses__()
-            if hasattr(cls, 'from_environment')
-        )
         try:
             latex_parser = parser.LatexParser(self.path)
-            latex_parser.parse(content)
             stack: List[Tuple[Optional[parser.Environment], Callable]] = [
                 (None, self.roots.append)]
-            latex_parser.walk(
-                lambda env: self._enter(env, stack, subclass_constructors),
-                lambda env: self._exit(env, stack))
+            try:
+                # Only the environments are needed, not the text
+                latex_parser.parse_and_walk(
+                    lambda env: self._enter(env, stack),
+                    lambda env: self._exit(env, stack),
+                    content=content)
+            finally:
+                # Keep the content, so that the file doesn't need to be read again for the default location
+                self.source = latex_parser.source
         except (exceptions.CompilerError, parser.LatexException, UnicodeError, FileNotFoundError) as ex:
             self.errors.setdefault(self.default_location, []).append(ex)
         return self
@@ -211,8 +277,7 @@ class IntermediateParser:
     def _enter(
             self,
             env: parser.Environment,
-            stack_of_add_child_operations: List[Tuple[Optional[parser.Environment], Callable]],
-            parse_tree_constructors: Collection[Callable[[parser.Environment], Any]]):
+            stack_of_add_child_operations: List[Tuple[Optional[parser.Environment], Callable]]):
         """ Handles entering an environment while walking through the from the parser generated syntax tree.
 
         Args:
@@ -220,24 +285,16 @@ class IntermediateParser:
             stack_of_add_child_operations (List[Tuple[Optional[parser.Environment], Callable]]): A stack that keeps track of
                 which environments are currently entered.
                 The top if this stack will be used to add the current environment to after it is parased.
-            parse_tree_constructors (Collection[Callable[[parser.Environment], Any]]): A collection of constructors
-                that generate a IntermediateParseTree subclass instance.
-                The first constructor that does not return None will be accepted the correct parsing of the given environment.
         """
+        constructor = _get_environment_constructor(env.env_name)
+        if constructor is None:
+            # There is no IntermediateParseTree responsible for this environment.
+            # This means that it is some other environment
+            # that has no inpact on the final symbol structure and can be ignored.
+            return
         try:
-            tree: Optional[IntermediateParseTree] = next(
-                filter(
-                    # Remove all constructors that returned None because it decided that the parsing of the environment is not it's job.
-                    None,
-                    # Try out all constructors on the current environment
-                    map(
-                        lambda from_environment: from_environment(env),
-                        parse_tree_constructors)
-                    # Return default None if there is no from_environment method
-                    # that is responsible for the parsing of this environment
-                    # This means that it is some other environment
-                    # that has no inpact on the final symbol structure and can be ignored.
-                ), None)
+            from_environment, match = constructor
+            tree: Optional[IntermediateParseTree] = from_environment(env, match)
             if tree:
                 # Get the top stack operation and add this tree as a child
                 if stack_of_add_child_operations[-1]:
@@ -260,12 +317,14 @@ class IntermediateParser:
     def default_location(self) -> vscode.Location:
         """ Returns a location with a range that contains the whole file
             or just the range from 0 to 0 if the file can't be openened.
+            The file is only read if it wasn't already read by `parse`.
         """
         try:
-            content = self.path.read_text()
-            lines = content.split('\n')
-            num_lines = len(lines)
-            len_last_line = len(lines[-1])
+            content = self.source
+            if content is None:
+                content = self.path.read_text()
+            num_lines = content.count('\n') + 1
+            len_last_line = len(content) - content.rfind('\n') - 1
             return vscode.Location(self.path.as_uri(), vscode.Range(vscode.Position(0, 0), vscode.Position(num_lines - 1, len_last_line - 1)))
         except Exception:
             return vscode.Location(self.path.as_uri(), vscode.Position(0, 0))
@@ -280,8 +339,9 @@ class ScopeIntermediateParseTree(IntermediateParseTree):
         self.scope_name = scope_name
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ScopeIntermediateParseTree]:
-        match = ScopeIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ScopeIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_SCOPE(e.env_name)
         if not match:
             return None
         if e.name is None:
@@ -293,6 +353,9 @@ class ScopeIntermediateParseTree(IntermediateParseTree):
         return f'[Scope "{self.scope_name.text}"]'
 
 
+_MATCH_SCOPE = ScopeIntermediateParseTree.PATTERN.fullmatch
+
+
 class ModsigIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'modsig')
 
@@ -307,8 +370,9 @@ class ModsigIntermediateParseTree(IntermediateParseTree):
         return self
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ModsigIntermediateParseTree]:
-        match = ModsigIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ModsigIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_MODSIG(e.env_name)
         if not match:
             return None
         if not e.rargs:
@@ -322,6 +386,9 @@ class ModsigIntermediateParseTree(IntermediateParseTree):
         return f'[Modsig name={self.name.text}]'
 
 
+_MATCH_MODSIG = ModsigIntermediateParseTree.PATTERN.fullmatch
+
+
 class ModnlIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'(mh)?modnl')
 
@@ -335,6 +402,9 @@ class ModnlIntermediateParseTree(IntermediateParseTree):
         self.name = name
         self.lang = lang
         self.mh = mh_mode
+        # Guessed path to the file of the attached module:
+        # A binding "path/to/module.lang.tex" is attached to the module in "path/to/module.tex"
+        self.path: Path = location.path.parent / (name.text + '.tex')
 
     def find_parent_module_name(self) -> str:
         return self.name.text
@@ -342,30 +412,10 @@ class ModnlIntermediateParseTree(IntermediateParseTree):
     def find_parent_module_parse_tree(self):
         return self
 
-    @property
-    def path(self) -> Path:
-        ''' Guesses the path to the file of the attached module.
-
-        Takes the path of the file this language binding is located and
-        returns the default path to the attached module.
-
-        Returns:
-            Path: Path to module file.
-
-        Examples:
-            >>> binding_path = Path('path/to/glossary/repo/source/module/module.lang.tex')
-            >>> binding_location = Location(binding_path, None)
-            >>> module_name = TokenWithLocation('module', None)
-            >>> binding_lang = TokenWithLocation('lang', None)
-            >>> binding = Modnl(binding_location, module_name, binding_lang, False)
-            >>> binding.path.as_posix()
-            'path/to/glossary/repo/source/module/module.tex'
-        '''
-        return (self.location.path.parents[0] / (self.name.text + '.tex'))
-
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ModnlIntermediateParseTree]:
-        match = ModnlIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ModnlIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_MODNL(e.env_name)
         if not match:
             return None
         if len(e.rargs) != 2:
@@ -383,6 +433,9 @@ class ModnlIntermediateParseTree(IntermediateParseTree):
         return f'[{mh}Modnl {self.name.text} lang={self.lang.text}]'
 
 
+_MATCH_MODNL = ModnlIntermediateParseTree.PATTERN.fullmatch
+
+
 class ViewIntermediateParseTree(IntermediateParseTree):
     # TODO: possibly mhview should be separate -- the same way as module is separated from mhmodnl
     PATTERN = re.compile(r'mhview(nl)?|gviewnl')
@@ -415,8 +468,9 @@ class ViewIntermediateParseTree(IntermediateParseTree):
         return self.module.text
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ViewIntermediateParseTree]:
-        match = cls.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ViewIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_VIEW(e.env_name)
         if not match:
             return None
         _, named = TokenWithLocation.parse_oargs(e.oargs)
@@ -453,6 +507,9 @@ class ViewIntermediateParseTree(IntermediateParseTree):
         )
 
 
+_MATCH_VIEW = ViewIntermediateParseTree.PATTERN.fullmatch
+
+
 class ViewSigIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile('gviewsig')
 
@@ -475,8 +532,9 @@ class ViewSigIntermediateParseTree(IntermediateParseTree):
         return self.module.text
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ViewSigIntermediateParseTree]:
-        match = ViewSigIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ViewSigIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_VIEWSIG(e.env_name)
         if not match:
             return None
         if len(e.rargs) < 3:
@@ -496,6 +554,9 @@ class ViewSigIntermediateParseTree(IntermediateParseTree):
         return f'[ViewSig "{self.module}" from "{self.fromrepos}" with source "{self.source_module}" and target "{self.target_module}"]'
 
 
+_MATCH_VIEWSIG = ViewSigIntermediateParseTree.PATTERN.fullmatch
+
+
 class ModuleIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'(module(\*)?)|(smentry)')
 
@@ -519,8 +580,9 @@ class ModuleIntermediateParseTree(IntermediateParseTree):
         return f'[Module {module}]'
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ModuleIntermediateParseTree]:
-        match = cls.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ModuleIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_MODULE(e.env_name)
         if match is None:
             return None
         _, named = TokenWithLocation.parse_oargs(e.oargs)
@@ -530,6 +592,9 @@ class ModuleIntermediateParseTree(IntermediateParseTree):
         )
 
 
+_MATCH_MODULE = ModuleIntermediateParseTree.PATTERN.fullmatch
+
+
 class GStructureIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'gstructure(\*)?')
 
@@ -539,8 +604,9 @@ class GStructureIntermediateParseTree(IntermediateParseTree):
         self.module = module
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[GStructureIntermediateParseTree]:
-        match = cls.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[GStructureIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_GSTRUCTURE(e.env_name)
         if match is None:
             return None
         if len(e.rargs) != 2:
@@ -557,6 +623,9 @@ class GStructureIntermediateParseTree(IntermediateParseTree):
         return f'[GStructure "{self.module}"]'
 
 
+_MATCH_GSTRUCTURE = GStructureIntermediateParseTree.PATTERN.fullmatch
+
+
 class DefiIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'([ma]*)(d|D)ef([ivx]+)(s)?(\*)?')
 
@@ -583,26 +652,25 @@ class DefiIntermediateParseTree(IntermediateParseTree):
         if i + int(a) != len(tokens):
             raise exceptions.CompilerError(
                 f'Defi argument count mismatch: Expected {i + int(a)} vs actual {len(tokens)}.')
-
-    @property
-    def name(self) -> str:
-        if self.name_annotation:
-            return self.name_annotation.text
-        if self.a:
-            return '-'.join(t.text for t in self.tokens[1:])
-        return '-'.join(t.text for t in self.tokens)
+        # Name of the defined symbol: Either the name annotation or generated by joining the tokens with a '-' character
+        self.name: str = (
+            name_annotation.text
+            if name_annotation
+            else _intern('-'.join([t.text for t in tokens[int(a):]])))
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[DefiIntermediateParseTree]:
-        match = DefiIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[DefiIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_DEFI(e.env_name)
         if match is None:
             return None
         if not e.rargs:
             raise exceptions.CompilerError(
                 'Argument count mismatch (expected at least 1, found 0).')
         _, named = TokenWithLocation.parse_oargs(e.oargs)
+        flags, letter, roman, s, asterisk = match.groups()
         try:
-            i = roman_numerals.roman2int(match.group(3))
+            i = roman_numerals.roman2int(roman)
         except ValueError:
             raise exceptions.CompilerError(
                 f'Invalid environment (are the roman numerals correct?): {e.env_name}')
@@ -610,17 +678,20 @@ class DefiIntermediateParseTree(IntermediateParseTree):
             location=e.location,
             tokens=list(map(TokenWithLocation.from_node, e.rargs)),
             name_annotation=named.get('name'),
-            m='m' in match.group(1),
-            a='a' in match.group(1),
-            capital=match.group(2) == 'D',
+            m='m' in flags,
+            a='a' in flags,
+            capital=letter == 'D',
             i=i,
-            s=match.group(4) is not None,
-            asterisk=match.group(5) is not None)
+            s=s is not None,
+            asterisk=asterisk is not None)
 
     def __repr__(self):
         return f'[Def{"i"*self.i} "{self.name}"]'
 
 
+_MATCH_DEFI = DefiIntermediateParseTree.PATTERN.fullmatch
+
+
 class TrefiIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'([ma]*)(d|D|t|T)ref([ivx]+)(s)?(\*)?')
 
@@ -649,20 +720,23 @@ class TrefiIntermediateParseTree(IntermediateParseTree):
         if i + int(a) != len(tokens):
             raise exceptions.CompilerError(
                 f'Trefi argument count mismatch: Expected {i + int(a)} vs. actual {len(tokens)}.')
-
-    @property
-    def name(self) -> str:
-        ''' Parses the targeted symbol's name.
-
-        The target's name is either given in the annotations
-        by using the ?<symbol> syntax or else it is generated
-        by joining the tokens with a '-' character.
-        '''
-        if self.target_annotation and '?' in self.target_annotation.text:
-            return self.target_annotation.text.split('?')[-1].strip()
-        tokens = (t.text for t in self.tokens[int(self.a):])
-        generated = '-'.join(tokens)
-        return generated.strip()
+        # The annotation is parsed once here: It is either "<module>?<symbol>", "?<symbol>" or "<module>"
+        # Symbol name given in the annotation or None if the annotation has no "?"
+        self.target_symbol: Optional[str] = None
+        self._module: Optional[TokenWithLocation] = target_annotation
+        if target_annotation is not None:
+            text = target_annotation.text
+            index = text.find('?')
+            if index >= 0:
+                self.target_symbol = text[text.rfind('?') + 1:].strip()
+                left, _ = target_annotation.split(index, 1)
+                self._module = left if left.text else None
+        # Name of the targeted symbol: Either given in the annotation by using
+        # the ?<symbol> syntax or else generated by joining the tokens with a '-' character
+        self.name: str = _intern(
+            self.target_symbol
+            if self.target_symbol is not None
+            else '-'.join([t.text for t in tokens[int(a):]]).strip())
 
     @property
     def module(self) -> Optional[TokenWithLocation]:
@@ -670,36 +744,30 @@ class TrefiIntermediateParseTree(IntermediateParseTree):
 
         Returns None if no module is explicitly named.
         '''
-        if self.target_annotation:
-            if '?' in self.target_annotation.text:
-                index = self.target_annotation.text.index('?')
-                left, _ = self.target_annotation.split(index, 1)
-                if left.text:
-                    return left  # return left in case of <module>?<symbol>
-                return None  # return None in case of ?symbol
-            # return the whole thing in case of [module]
-            return self.target_annotation
-        return None  # return None if no oargs are given
+        return self._module
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[TrefiIntermediateParseTree]:
-        match = TrefiIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[TrefiIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_TREFI(e.env_name)
         if match is None:
             return None
         if not e.rargs:
             raise exceptions.CompilerError(
                 'Argument count mismatch (expected at least 1, found 0).')
-        if len(e.unnamed_args) > 1:
+        unnamed_args = e.unnamed_args
+        if len(unnamed_args) > 1:
             raise exceptions.CompilerError(
-                f'Too many unnamed oargs in trefi: Expected are at most 1, found {len(e.unnamed_args)}')
+                f'Too many unnamed oargs in trefi: Expected are at most 1, found {len(unnamed_args)}')
         annotations = (
-            TokenWithLocation.from_node(e.unnamed_args[0])
-            if e.unnamed_args
+            TokenWithLocation.from_node(unnamed_args[0])
+            if unnamed_args
             else None
         )
         tokens = list(map(TokenWithLocation.from_node, e.rargs))
+        flags, letter, roman, s, asterisk = match.groups()
         try:
-            i = roman_numerals.roman2int(match.group(3))
+            i = roman_numerals.roman2int(roman)
         except ValueError:
             raise exceptions.CompilerError(
                 f'Invalid environment (are the roman numerals correct?): {e.env_name}')
@@ -707,13 +775,13 @@ class TrefiIntermediateParseTree(IntermediateParseTree):
             location=e.location,
             tokens=tokens,
             target_annotation=annotations,
-            m='m' in match.group(1),
-            a='a' in match.group(1),
-            capital=match.group(2) == 'T',
-            drefi=match.group(2) in ('d', 'D'),
+            m='m' in flags,
+            a='a' in flags,
+            capital=letter == 'T',
+            drefi=letter in ('d', 'D'),
             i=i,
-            s=match.group(4) is not None,
-            asterisk=match.group(5) is not None,
+            s=s is not None,
+            asterisk=asterisk is not None,
         )
 
     def __repr__(self):
@@ -721,6 +789,9 @@ class TrefiIntermediateParseTree(IntermediateParseTree):
         return f'[Tref{"i"*self.i} "{self.name}"{module}]'
 
 
+_MATCH_TREFI = TrefiIntermediateParseTree.PATTERN.fullmatch
+
+
 class _NoverbHandler:
     def __init__(
             self,
@@ -738,9 +809,10 @@ class _NoverbHandler:
         noverb: Optional[TokenWithLocation] = self.named.get('noverb')
         if noverb is None:
             return set()
-        if (noverb.text[0], noverb.text[-1]) == ('{', '}'):
-            return set(noverb.text[1:-1].split(','))
-        return set([noverb.text])
+        text = noverb.text
+        if text.startswith('{') and text.endswith('}'):
+            return set(text[1:-1].split(','))
+        return {text}
 
 
 class SymIntermediateParserTree(IntermediateParseTree):
@@ -762,14 +834,13 @@ class SymIntermediateParserTree(IntermediateParseTree):
         if i != len(tokens):
             raise exceptions.CompilerError(
                 f'Symi argument count mismatch: Expected {i} vs actual {len(tokens)}.')
-
-    @property
-    def name(self) -> str:
-        return '-'.join(token.text for token in self.tokens)
+        # Name of the symbol generated by joining the tokens with a '-' character
+        self.name: str = _intern('-'.join([token.text for token in tokens]))
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[SymIntermediateParserTree]:
-        match = SymIntermediateParserTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[SymIntermediateParserTree]:
+        if match is None:
+            match = _MATCH_SYM(e.env_name)
         if match is None:
             return None
         if not e.rargs:
@@ -794,6 +865,9 @@ class SymIntermediateParserTree(IntermediateParseTree):
         return f'[Sym{"i"*self.i}{"*"*self.asterisk} "{self.name}"]'
 
 
+_MATCH_SYM = SymIntermediateParserTree.PATTERN.fullmatch
+
+
 class SymdefIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'(var|sym)def(\*)?')
 
@@ -812,8 +886,9 @@ class SymdefIntermediateParseTree(IntermediateParseTree):
         self.asterisk: bool = asterisk
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[SymdefIntermediateParseTree]:
-        match = SymdefIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[SymdefIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_SYMDEF(e.env_name)
         if match is None:
             return None
         if not e.rargs:
@@ -834,6 +909,9 @@ class SymdefIntermediateParseTree(IntermediateParseTree):
         return f'[Symdef{"*"*self.asterisk} "{self.name.text}"]'
 
 
+_MATCH_SYMDEF = SymdefIntermediateParseTree.PATTERN.fullmatch
+
+
 class ImportModuleIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'(import|use)(mh)?module(\*)?')
 
@@ -859,7 +937,7 @@ class ImportModuleIntermediateParseTree(IntermediateParseTree):
         self.export = export
         self.mh_mode = mh_mode
         self.asterisk = asterisk
-        if len(list(self.location.path.parents)) < 4:
+        if len(self.location.path.parents) < 4:
             raise exceptions.CompilerWarning(
                 f'Unable to compile module with a path depth of less than 4: {self.location.path}')
         if mh_mode:
@@ -906,21 +984,21 @@ class ImportModuleIntermediateParseTree(IntermediateParseTree):
             module: The module name extracted from the required latex arguments.
         """
         if load:
-            return (root / load / (module + '.tex')).expanduser().resolve().absolute()
+            return _resolve(os.path.join(root, load, module + '.tex'))
         if not mhrepo and not path and not dir:
-            return (current_file).expanduser().resolve().absolute()
+            return _resolve(os.fspath(current_file))
         if mhrepo:
-            source: Path = root / mhrepo / 'source'
+            source = os.path.join(root, mhrepo, 'source')
         else:
-            source = util.find_source_dir(root, current_file)
+            source = os.fspath(util.find_source_dir(root, current_file))
         if dir:
-            result = source / dir / (module + '.tex')
+            result = os.path.join(source, dir, module + '.tex')
         elif path:
-            result = source / (path + '.tex')
+            result = os.path.join(source, path + '.tex')
         else:
             raise ValueError(
                 'Invalid arguments: "path" or "dir" must be specified if "mhrepo" is.')
-        return result.expanduser().resolve().absolute()
+        return _resolve(result)
 
     def path_to_imported_file(self, root: Path) -> Path:
         ' Calls the classmethod build_path_to_imported_module with information from this instance. '
@@ -942,8 +1020,9 @@ class ImportModuleIntermediateParseTree(IntermediateParseTree):
         return f'[{access.value} ImportModule "{self.module.text}"{from_}]'
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[ImportModuleIntermediateParseTree]:
-        match = ImportModuleIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[ImportModuleIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_IMPORT(e.env_name)
         if match is None:
             return None
         if len(e.rargs) != 1:
@@ -965,6 +1044,9 @@ class ImportModuleIntermediateParseTree(IntermediateParseTree):
         )
 
 
+_MATCH_IMPORT = ImportModuleIntermediateParseTree.PATTERN.fullmatch
+
+
 class GImportIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'g(import|use)(\*)?')
 
@@ -1000,12 +1082,12 @@ class GImportIntermediateParseTree(IntermediateParseTree):
         """
         if repo is not None:
             assert current_file.relative_to(root)
-            source = root / repo / 'source'
+            source = os.path.join(root, repo, 'source')
         else:
             # TODO: What is the path to imported module if repo in gimport[repo] is not given?
-            source = current_file.parent
-        path = (source / module).with_suffix('.tex')
-        return path.expanduser().resolve().absolute()
+            source = os.path.dirname(current_file)
+        path, _ = os.path.splitext(os.path.join(source, module))
+        return _resolve(path + '.tex')
 
     def path_to_imported_file(self, root: Path) -> Path:
         ''' Returns the path to the module file this gimport points to. '''
@@ -1016,8 +1098,9 @@ class GImportIntermediateParseTree(IntermediateParseTree):
             module=self.module.text.strip())
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[GImportIntermediateParseTree]:
-        match = GImportIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[GImportIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_GIMPORT(e.env_name)
         if match is None:
             return None
         if len(e.rargs) != 1:
@@ -1031,7 +1114,7 @@ class GImportIntermediateParseTree(IntermediateParseTree):
         return GImportIntermediateParseTree(
             location=e.location,
             module=module,
-            repository=next(iter(unnamed), None),
+            repository=unnamed[0] if unnamed else None,
             export=match.group(1) == 'import',
             asterisk=match.group(2) is not None,
         )
@@ -1045,6 +1128,9 @@ class GImportIntermediateParseTree(IntermediateParseTree):
         return f'[{access.value} gimport{"*"*self.asterisk} "{self.module.text}"{from_}]'
 
 
+_MATCH_GIMPORT = GImportIntermediateParseTree.PATTERN.fullmatch
+
+
 class TassignIntermediateParseTree(IntermediateParseTree):
     PATTERN = re.compile(r'(?P<at>[tv])assign(?P<asterisk>\*?)')
 
@@ -1064,8 +1150,9 @@ class TassignIntermediateParseTree(IntermediateParseTree):
         self.asterisk = asterisk
 
     @classmethod
-    def from_environment(cls, e: parser.Environment) -> Optional[TassignIntermediateParseTree]:
-        match = TassignIntermediateParseTree.PATTERN.fullmatch(e.env_name)
+    def from_environment(cls, e: parser.Environment, match: Optional[Match[str]] = None) -> Optional[TassignIntermediateParseTree]:
+        if match is None:
+            match = _MATCH_TASSIGN(e.env_name)
         if match is None:
             return None
         if len(e.rargs) != 2:
@@ -1089,3 +1176,6 @@ class TassignIntermediateParseTree(IntermediateParseTree):
             target_term=target_term,
             asterisk=match.group('asterisk') is not None,
         )
+
+
+_MATCH_TASSIGN = TassignIntermediateParseTree.PATTERN.fullmatch
@@ -35,13 +35,7 @@ class ReferenceType(Flag):
             >>> (ReferenceType.MODULE|ReferenceType.MODSIG).contains_any_of(ReferenceType.DEF|ReferenceType.SYMDEF)
             False
         """
-        for exp in range(0, 1 + other.value):
-            mask = 1 << exp
-            if mask > other.value:
-                break
-            if ReferenceType(other.value & mask) in self:
-                return True
-        return False
+        return bool(self.value & other.value)
 
     def format_enum(self):
         """ Formats the flag as a list in case multiple are possible like: "module" or "modsig" for ReferenceType.MODULE|MODSIG
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import sys
 from typing import List, Optional, Sequence, Tuple, Union
 
 from .. import vscode
@@ -13,6 +14,10 @@ __all__ = ['Reference']
 class Reference:
     ' Container that contains information about which symbol is referenced by name. '
 
+    # References are created for every reference environment, so they don't carry a __dict__.
+    # The pickled state still is a dict of the attributes, so that objectfiles keep their layout.
+    __slots__ = ('range', 'scope', 'name', 'reference_type', 'resolved_symbols', 'parent')
+
     def __init__(
             self,
             range: vscode.Range,
@@ -38,10 +43,18 @@ class Reference:
         assert all(isinstance(i, str) for i in name)
         self.range = range
         self.scope = scope
-        self.name: Tuple[str, ...] = tuple(name)
+        # Names are interned, because the same module and symbol names are referenced over and over again
+        self.name: Tuple[str, ...] = tuple(map(sys.intern, name))
         self.reference_type: ReferenceType = reference_type
         self.resolved_symbols: List[symbols.Symbol] = []
         self.parent = parent
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self):
         return f'[Reference  "{"?".join(self.name)}" of type {self.reference_type.format_enum()} at {self.range.start.format()}]'
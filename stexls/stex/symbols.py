@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import sys
 import uuid
 from enum import Enum, Flag
 from typing import (Callable, Dict, Iterable, Iterator, List, Optional, Set,
@@ -109,7 +110,7 @@ class Symbol:
         """
         assert location is not None, "Invalid symbol location"
         assert isinstance(name, str), "Member 'name' is not of type str"
-        self.name: str = name
+        self.name: str = sys.intern(name)
         self.parent: Optional[Symbol] = None
         self.children: Dict[str, List[Symbol]] = dict()
         self.location = location
@@ -1,3 +1,4 @@
+import functools
 from pathlib import Path
 
 
@@ -20,10 +21,10 @@ def find_source_dir(root: Path, file: Path) -> Path:
     """
     rel = file.relative_to(root)
     i = rel.parts.index('source')
-    rel_source = list(rel.parents)[-2-i]
-    return root / rel_source
+    return root.joinpath(*rel.parts[:i + 1])
 
 
+@functools.lru_cache(maxsize=1024)
 def get_repository_name(root: Path, file: Path) -> str:
     """ Extracts the repository identifier from a filepath relative a certain root.
 
@@ -46,6 +47,7 @@ def get_repository_name(root: Path, file: Path) -> str:
     return '/'.join(source.parent.parts[-i:])
 
 
+@functools.lru_cache(maxsize=1024)
 def get_path(root: Path, file: Path) -> str:
     """ Extracts the relative path between the source directory of a file and the file itself, INCLUDING the file
     but without the extension.
@@ -70,6 +72,7 @@ def get_path(root: Path, file: Path) -> str:
     return str(rel.parent / rel.stem)
 
 
+@functools.lru_cache(maxsize=1024)
 def get_dir(root: Path, file: Path) -> Path:
     """ Extracts the directory relative to the source directory of the file.
 
@@ -1,11 +1,13 @@
 import datetime
 import json
+import logging
 import os
 import pickle
-from collections import Counter
+from collections import Counter, OrderedDict
+from hashlib import blake2b
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Callable, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Union
 from zipfile import ZipFile
 
 import numpy as np
@@ -25,10 +27,64 @@ from . import base, tags
 
 __all__ = ['Seq2SeqModel']
 
+log = logging.getLogger(__name__)
+
 _VERSION_MAJOR = 1
 _VERSION_MINOR = 0
 
 
+def _input_name(tensor_name: str) -> str:
+    ' Maps the name of a tflite input tensor (e.g. "serving_default_tokens:0") to the name of the keras input. '
+    name = tensor_name.split(':')[0]
+    for input_name in ('tokens', 'tfidf', 'keyphraseness', 'pos'):
+        if name.endswith(input_name):
+            return input_name
+    raise ValueError(f'Unknown model input: {tensor_name}')
+
+
+# Maximum absolute difference between the predictions of the quantized and the keras model
+# on held-out data for the quantized model to be saved
+_QUANTIZATION_TOLERANCE = 0.05
+
+# Number of held-out samples the quantized model is compared with the keras model on
+_QUANTIZATION_VALIDATION_SAMPLES = 32
+
+# Maximum number of files for which the predictions are cached
+_PREDICTION_CACHE_SIZE = 4096
+
+
+def _read_content(file: Union[str, Path, LatexParser]) -> Optional[str]:
+    ' Reads the content of the file the same way the latex parser does. Returns None if the content can not be read. '
+    if isinstance(file, LatexParser):
+        if file.source is not None:
+            return file.source
+        path, encoding = file.file, file.encoding
+    else:
+        path, encoding = file, 'utf-8'
+    try:
+        with open(path, encoding=encoding) as fd:
+            return fd.read()
+    except (OSError, UnicodeError):
+        return None
+
+
+def _prediction_cache_key(content: Optional[str]) -> Optional[bytes]:
+    ' Hashes the content of a file. Returns None if the content could not be read. '
+    if content is None:
+        return None
+    return blake2b(content.encode(), digest_size=16).digest()
+
+
+def _tokenize(file: Union[str, Path, LatexParser], content: Optional[str]) -> Optional[LatexTokenizer]:
+    ' Creates the tokenizer of the file, parsing the already read content instead of reading the file again. None if the file could not be read. '
+    if content is None:
+        return None
+    latex_parser = file if isinstance(file, LatexParser) else LatexParser(file)
+    if not latex_parser.parsed:
+        latex_parser.parse(content)
+    return LatexTokenizer.from_file(latex_parser)
+
+
 class Seq2SeqModel(base.Model):
     def __init__(self):
         super().__init__(
@@ -41,6 +97,10 @@ class Seq2SeqModel(base.Model):
         self.keyphraseness_model: KeyphrasenessModel = None
         self.pos_tag_model: PosTagModel = None
         self.glove: GloVe = None
+        # Optional int8 quantized version of `self.model` used for faster inference
+        self.quantized_model: Optional[tf.lite.Interpreter] = None
+        # LRU cache of predictions with the hash of the file content as key
+        self._prediction_cache: OrderedDict[bytes, List[tags.Tag]] = OrderedDict()
 
     def _create_data(
             self,
@@ -245,34 +305,120 @@ class Seq2SeqModel(base.Model):
             filename = now.strftime('%y-%m-%d.%H:%M:%S.model')
             filepath = os.path.join(save_dir, filename)
             print('Saving model to', filepath)
-            self.save(filepath)
+            self.save(filepath, validation_inputs={
+                name: value[:_QUANTIZATION_VALIDATION_SAMPLES]
+                for name, value in x_test.items()
+            })
 
     def predict(self, *files: Union[str, Path, LatexParser]) -> List[List[tags.Tag]]:
+        ''' Predicts the tags of the tokens of each file.
+
+        Predictions are cached by the hash of the file content,
+        so that only files with previously unseen content are given to the model.
+        Files that can not be tokenized are left out of the result.
+        '''
+        # Each file is read once for both the cache key and the tokenizer
+        contents = list(map(_read_content, files))
+        keys = list(map(_prediction_cache_key, contents))
+        predicted: Dict[int, List[tags.Tag]] = {}
+        indices = []
         documents = []
         all_tokens = []
-        for tokenizer, file in zip(map(LatexTokenizer.from_file, files), files):
+        for i, (file, content, key) in enumerate(zip(files, contents, keys)):
+            if key is not None and key in self._prediction_cache:
+                continue
+            tokenizer = _tokenize(file, content)
             if tokenizer is None:
                 continue
             tokens = list(tokenizer.tokens())
+            indices.append(i)
             all_tokens.append(tokens)
             lexemes = [t.lexeme for t in tokens]
             documents.append(lexemes)
-        inputs = {
-            'tokens': pad_sequences(self.glove.transform(documents), dtype=np.float32),
-            'keyphraseness': np.expand_dims(pad_sequences(self.keyphraseness_model.transform(documents), dtype=np.float32), axis=-1),
-            'tfidf': np.expand_dims(pad_sequences(self.tfidf_model.transform(documents), dtype=np.float32), axis=-1),
-            'pos': pad_sequences(self.pos_tag_model.predict(documents), dtype=np.float32),
-        }
-        return [
-            [
-                tags.Tag(float(pred[0]), token)
-                for pred, token in zip(doc[-len(tokens):], tokens)
-            ]
-            for doc, tokens in zip(self.model.predict(inputs), all_tokens)
-        ]
-
-    def save(self, path):
-        """ Saves the current state """
+        if documents:
+            inputs = {
+                'tokens': pad_sequences(self.glove.transform(documents), dtype=np.float32),
+                'keyphraseness': np.expand_dims(pad_sequences(self.keyphraseness_model.transform(documents), dtype=np.float32), axis=-1),
+                'tfidf': np.expand_dims(pad_sequences(self.tfidf_model.transform(documents), dtype=np.float32), axis=-1),
+                'pos': pad_sequences(self.pos_tag_model.predict(documents), dtype=np.float32),
+            }
+            for i, doc, tokens in zip(indices, self._predict_inputs(inputs), all_tokens):
+                predicted[i] = [
+                    tags.Tag(float(pred[0]), token)
+                    for pred, token in zip(doc[-len(tokens):], tokens)
+                ]
+                if keys[i] is not None:
+                    self._prediction_cache[keys[i]] = predicted[i]
+                    while len(self._prediction_cache) > _PREDICTION_CACHE_SIZE:
+                        self._prediction_cache.popitem(last=False)
+        results = []
+        for i, key in enumerate(keys):
+            if i in predicted:
+                results.append(list(predicted[i]))
+            elif key is not None and key in self._prediction_cache:
+                self._prediction_cache.move_to_end(key)
+                results.append(list(self._prediction_cache[key]))
+        return results
+
+    def _predict_inputs(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        ''' Runs the model on the padded inputs.
+
+        Uses the quantized model if available and falls back to the
+        keras model if the quantized model fails.
+        '''
+        if self.quantized_model is not None:
+            try:
+                return self._invoke_interpreter(self.quantized_model, inputs)
+            except Exception:
+                log.exception(
+                    'Quantized model failed: Falling back to the keras model.')
+                self.quantized_model = None
+        return self.model.predict(inputs)
+
+    @staticmethod
+    def _invoke_interpreter(interpreter: tf.lite.Interpreter, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        ' Runs a tflite model on the padded inputs, resizing its input tensors to the shape of the inputs. '
+        input_details = interpreter.get_input_details()
+        for detail in input_details:
+            interpreter.resize_tensor_input(
+                detail['index'], inputs[_input_name(detail['name'])].shape)
+        interpreter.allocate_tensors()
+        for detail in input_details:
+            interpreter.set_tensor(
+                detail['index'], inputs[_input_name(detail['name'])])
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]['index'])
+
+    def _is_close_to_keras(self, interpreter: tf.lite.Interpreter, inputs: Dict[str, np.ndarray]) -> bool:
+        ''' Checks that the predictions of a quantized model on the inputs stay within
+        `_QUANTIZATION_TOLERANCE` of the predictions of the keras model.
+        '''
+        try:
+            quantized = self._invoke_interpreter(interpreter, inputs)
+        except Exception:
+            log.exception('Failed to run the quantized model.')
+            return False
+        difference = float(np.max(np.abs(quantized - self.model.predict(inputs))))
+        print('Maximum difference between quantized and keras model predictions:', difference)
+        return difference <= _QUANTIZATION_TOLERANCE
+
+    def quantize(self) -> bytes:
+        ''' Converts the keras model to a tflite model with dynamic range (int8 weight) quantization. '''
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        # Recurrent layers with dynamic sequence lengths may require ops not available as tflite builtins
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        return converter.convert()
+
+    def save(self, path, validation_inputs: Optional[Dict[str, np.ndarray]] = None):
+        """ Saves the current state
+
+        Parameters:
+            path: Path of the created model package.
+            validation_inputs: Held-out inputs the quantized model is compared with the keras model on.
+                The quantized model is only added to the package if its predictions are close enough.
+        """
         with ZipFile(path, mode='w') as package:
             print('Creating zip package:', path)
             tmpfile = NamedTemporaryFile(suffix='.h5')
@@ -297,6 +443,18 @@ class Seq2SeqModel(base.Model):
                 self.settings, default=lambda x: x.__dict__)), 'characters.')
             package.writestr('settings.json', json.dumps(
                 self.settings, default=lambda x: x.__dict__))
+            if validation_inputs is None:
+                print('Skipping model.tflite: No held-out inputs to validate the quantized model with.')
+                return
+            try:
+                quantized = self.quantize()
+                if self._is_close_to_keras(tf.lite.Interpreter(model_content=quantized), validation_inputs):
+                    print('Adding model.tflite', len(quantized), 'bytes.')
+                    package.writestr('model.tflite', quantized)
+                else:
+                    print('Skipping model.tflite: The quantized model differs too much from the keras model.')
+            except Exception as err:
+                print('Failed to create quantized model:', err)
 
     @staticmethod
     def load(path) -> 'Seq2SeqModel':
@@ -318,6 +476,13 @@ class Seq2SeqModel(base.Model):
                 ref.flush()
                 self.model = models.load_model(ref.name)
             assert self.model is not None
+            if 'model.tflite' in package.namelist():
+                try:
+                    self.quantized_model = tf.lite.Interpreter(
+                        model_content=package.read('model.tflite'))
+                except Exception:
+                    log.exception(
+                        'Failed to load quantized model: Using the keras model.')
         return self
 
 
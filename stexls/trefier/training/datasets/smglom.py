@@ -1,4 +1,3 @@
-import multiprocessing as mp
 import os
 import pickle
 import re
@@ -6,7 +5,7 @@ import sys
 from enum import IntEnum
 from glob import glob
 from pathlib import Path
-from typing import Callable, Iterable, List, Sequence, Tuple, Union
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
 
 from stexls.latex import tokenizer
 from stexls.util import download
@@ -80,24 +79,21 @@ def load(
     files = files[:limit or len(files)]
     x = []
     y = []
-    with mp.Pool() as pool:
-        print('Parsing', len(files), 'files.')
-        if progress:
-            it = progress(pool.imap_unordered(
-                tokenizer.LatexTokenizer.from_file, files))
+    print('Parsing', len(files), 'files.')
+    it: Iterable[Optional[List[tokenizer.LatexToken]]] = tokenizer.tokenize_files(
+        files)
+    if progress:
+        it = progress(it)
+    for file, latex_tokens in zip(files, it):
+        tokens, labels = _parse_file(latex_tokens or [], binary)
+        if not tokens:
+            print('File', file, 'failed to generate tokens.', file=sys.stderr)
+        elif len(tokens) != len(labels):
+            raise RuntimeError('Unexpected lengths for tokens (%i) and labels (%i).' % (
+                len(tokens), len(labels)))
         else:
-            it = pool.map(tokenizer.LatexTokenizer.from_file, files)
-        for i, latex_tokens in filter(None, enumerate(it)):
-            tokens, labels = _parse_file(list(latex_tokens), binary)
-            if not tokens:
-                print(
-                    'File', '"?"' if progress else files[i], 'failed to generate tokens.', file=sys.stderr)
-            elif len(tokens) != len(labels):
-                raise RuntimeError('Unexpected lengths for tokens (%i) and labels (%i).' % (
-                    len(tokens), len(labels)))
-            else:
-                x.append(tokens)
-                y.append(labels)
+            x.append(tokens)
+            y.append(labels)
     return x, y
 
 
@@ -41,17 +41,18 @@ class KeyphrasenessModel:
             X {list} -- List of documents of tokens
             Y {list} -- List of documents of labels
         """
-        self.keyphraseness = {}
-        self.dfs = collections.defaultdict(float)  # document frequency
-        self.kfs = collections.defaultdict(int)  # keyphrase frequency
+        # Plain dicts are used, so that looking up words that never were a keyphrase doesn't insert them
+        dfs = collections.Counter()  # document frequency
+        kfs = collections.Counter()  # keyphrase frequency
         for doc, labels in zip(X, Y):
-            for word in set(doc):
-                self.dfs[word] += 1
-            keywords = (word for word, label in zip(doc, labels) if label != 0)
-            for word, count in collections.Counter(keywords).items():
-                self.kfs[word] += count
-        for word in self.dfs:
-            self.keyphraseness[word] = self.kfs[word] / self.dfs[word]
+            dfs.update(set(doc))
+            kfs.update(word for word, label in zip(doc, labels) if label != 0)
+        self.dfs = dict(dfs)
+        self.kfs = dict(kfs)
+        self.keyphraseness = {
+            word: self.kfs.get(word, 0) / df
+            for word, df in self.dfs.items()
+        }
 
     def fit_transform(self, X, Y):
         """Fits the object and transforms all samples as if it was not included in the fitting process
@@ -70,7 +71,7 @@ class KeyphrasenessModel:
             keywords = collections.Counter(
                 word for word, label in zip(doc, labels) if label != 0)
             result.append([
-                (self.kfs[word] - keywords.get(word, 0)) / (self.dfs[word] - 1)
+                (self.kfs.get(word, 0) - keywords.get(word, 0)) / (self.dfs[word] - 1)
                 if self.dfs[word] > 1 else 0
                 for word in doc
             ])
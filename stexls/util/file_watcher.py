@@ -2,6 +2,8 @@ import collections
 import itertools
 import os
 import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from pathlib import Path
 from typing import Dict, Optional, Pattern, Union
@@ -11,6 +13,15 @@ __all__ = ['WorkspaceWatcher', 'Changes']
 Changes = collections.namedtuple('Changes', ['created', 'modified', 'deleted'])
 
 
+def _file_mtime(path: Union[str, Path]) -> Optional[float]:
+    ' Stats the path once and returns the modified time if it is a regular file, None otherwise. '
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime if stat.S_ISREG(st.st_mode) else None
+
+
 class WorkspaceWatcher:
     """ Watches all files located inside a root workspace folder.
 
@@ -19,15 +30,22 @@ class WorkspaceWatcher:
     checked at once.
     """
 
-    def __init__(self, pattern, include: Union[Pattern, str] = None, ignore: Union[Pattern, str] = None):
+    def __init__(
+            self,
+            pattern,
+            include: Union[Pattern, str] = None,
+            ignore: Union[Pattern, str] = None,
+            max_workers: int = 32):
         """Initializes the watcher with a pattern of files to watch.
 
         Args:
             pattern: GLOB pattern of which files to add.
             include: Whitelist REGEX pattern. Used to filter out WANTED files. None to skip include step.
             ignore: Blacklist REGEX pattern. Used to filter out UNWANTED files. None to skip ignore step.
+            max_workers: Number of threads used to stat files concurrently.
         """
         self.pattern = pattern
+        self.max_workers = max_workers
         self.include: Optional[Pattern] = (
             re.compile(include)
             if isinstance(include, str)
@@ -48,21 +66,30 @@ class WorkspaceWatcher:
         Returns:
             Changes: Tuple of created, modified and deleted files.
         """
-        # split file index into delete and still existing files
-        old_files = set(filter(lambda x: os.path.isfile(x), self.files.keys()))
-        deleted = set(
-            filter(lambda x: not os.path.isfile(x), self.files.keys()))
         # get list of files & folders in the workspace
-        files = set(filter(os.path.isfile, glob(self.pattern, recursive=True)))
+        files = glob(self.pattern, recursive=True)
         # apply whitelist
         if self.include:
-            files = set(filter(self.include.match, files))
+            files = list(filter(self.include.match, files))
         # apply blacklist
         if self.ignore:
-            files = set(itertools.filterfalse(self.ignore.match, files))
+            files = list(itertools.filterfalse(self.ignore.match, files))
+        # stat every file exactly once, with many stats in flight at the same time
+        # because the time spent here is dominated by syscall latency
+        old_paths = list(self.files)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            old_mtimes = list(executor.map(_file_mtime, old_paths))
+            new_mtimes = list(executor.map(_file_mtime, files))
+        # split file index into delete and still existing files
+        old_files = set(
+            path for path, mtime in zip(old_paths, old_mtimes) if mtime is not None)
+        deleted = set(old_paths).difference(old_files)
         # create new index of files and modified times
-        file_index = dict(
-            map(lambda x: (Path(x).absolute(), os.path.getmtime(x)), files))
+        file_index = {
+            Path(path).absolute(): mtime
+            for path, mtime in zip(files, new_mtimes)
+            if mtime is not None
+        }
         # newly created files are the difference of files before and after update
         new_files = set(file_index)
         created = new_files.difference(old_files)
@@ -2,10 +2,16 @@
 _ROMAN_NUMERALS = ('i', 'ii', 'iii', 'iv', 'v', 'vi',
                    'vii', 'viii', 'ix', 'x', 'xi', 'xii')
 
+_ROMAN_NUMERAL_VALUES = {
+    numeral: i for i, numeral in enumerate(_ROMAN_NUMERALS, 1)}
+
 
 def int2roman(i: int) -> str:
     return _ROMAN_NUMERALS[i - 1]
 
 
 def roman2int(r: str) -> int:
-    return _ROMAN_NUMERALS.index(r) + 1
+    try:
+        return _ROMAN_NUMERAL_VALUES[r]
+    except KeyError:
+        raise ValueError(f'Invalid roman numeral: {r}') from None
@@ -2,7 +2,7 @@ import logging
 import itertools
 import time
 from pathlib import Path
-from typing import Dict, Optional, Set, Union
+from typing import Dict, Optional, Set, Tuple, Union
 
 from .. import vscode
 from .ignorefile import IgnoreFile
@@ -32,6 +32,61 @@ class TextDocument:
         self.text = text
         self.time_modified = time.time()
 
+    def offset_at(self, position: vscode.Position) -> int:
+        ''' Converts a position to an offset into the text.
+
+        Characters past the end of the line are clamped to the end of the line
+        and lines past the end of the text to the end of the text.
+        '''
+        begin = self._line_begin(position.line, 0, 0)
+        return self._clamp_character(begin, position.character)
+
+    def _line_begin(self, line: int, known_line: int, known_begin: int) -> Optional[int]:
+        ' Finds the offset of the beginning of `line`, starting from the known beginning of a previous line. None if the text has less lines. '
+        begin = known_begin
+        for _ in range(line - known_line):
+            newline = self.text.find('\n', begin)
+            if newline < 0:
+                return None
+            begin = newline + 1
+        return begin
+
+    def _clamp_character(self, begin: Optional[int], character: int) -> int:
+        ''' Returns the offset of the character in the line beginning at `begin`, clamped to the end of the line.
+
+        The character is counted in UTF-16 code units like positions of the language server protocol.
+        '''
+        if begin is None:
+            return len(self.text)
+        end = self.text.find('\n', begin)
+        if end < 0:
+            end = len(self.text)
+        offset = min(begin + character, end)
+        if self.text[begin:offset].isascii():
+            return offset
+        # Characters outside of the basic multilingual plane are two UTF-16 code units long
+        offset = begin
+        units = 0
+        while offset < end and units < character:
+            units += 2 if ord(self.text[offset]) > 0xFFFF else 1
+            offset += 1
+        return offset
+
+    def patch(self, version: int, range: vscode.Range, text: str):
+        ''' Replaces the text inside the range with the given text and updates the version and timestamp.
+
+        The end of the range is searched for starting at the line of the start,
+        so that the text is only scanned once up to the edit.
+        '''
+        start_line = self._line_begin(range.start.line, 0, 0)
+        begin = self._clamp_character(start_line, range.start.character)
+        if start_line is not None and range.end.line >= range.start.line:
+            end_line = self._line_begin(range.end.line, range.start.line, start_line)
+        else:
+            end_line = self._line_begin(range.end.line, 0, 0)
+        end = self._clamp_character(end_line, range.end.character)
+        self.update(version, self.text[:begin] + text + self.text[end:])
+
 
 class Workspace:
     def __init__(self, root: Union[str, Path], ignorefile: Optional[Union[str, Path]] = None):
@@ -50,6 +105,8 @@ class Workspace:
         self.ignorefile: Optional[IgnoreFile] = None
         if ignorefile:
             self.ignorefile = IgnoreFile(ignorefile, root=self.root)
+        # Files found by the last scan of the root directory or None if not scanned yet
+        self._files: Optional[Set[Path]] = None
 
     def is_open(self, file: Path) -> bool:
         ' Returns true if a modified version of this file that can be queried with read_file() is in memory. '
@@ -118,6 +175,22 @@ class Workspace:
         document.update(version, text)
         return True
 
+    def patch_file(self, path: Path, version: int, range: vscode.Range, text: str) -> bool:
+        ' Replaces the text inside range of an already added file. Returns True on success. '
+        if not self.is_open(path):
+            log.warning(
+                'Unable to patch file that has not been opened: "%s"', path)
+            return False
+        document = self._open_files[path]
+        if version < document.version:
+            log.warning(
+                'Ignoring file patch with lower version number: %i < %i', version, document.version)
+            return False
+        log.debug('Patching %s of "%s": from version %i to %i',
+                  range, path, document.version, version)
+        document.patch(version, range, text)
+        return True
+
     def close_file(self, path: Path) -> bool:
         """ Removes an opened file from ram.
 
@@ -148,6 +221,16 @@ class Workspace:
             return document.text
         return None
 
+    def read_buffer_and_time_modified(self, path: Path) -> Tuple[Optional[str], float]:
+        """ Reads the file's buffered content together with the time it was modified.
+
+        The buffers are updated by the server while the linter reads them from another thread.
+        The timestamp is read before the content, so that a concurrent update can at worst
+        pair new content with an older timestamp, which only causes the content to be compiled again.
+        """
+        time_modified = self.get_time_buffer_modified(path)
+        return self.read_buffer(path), time_modified
+
     def read_file(self, path: Path) -> Optional[str]:
         """ Gets the most up to date content of the file @path.
 
@@ -191,7 +274,25 @@ class Workspace:
 
     @property
     def files(self) -> Set[Path]:
-        ' Returns the set of .tex files in this workspace after they are filtered using ignore and include patterns. '
+        """ Returns the set of .tex files in this workspace after they are filtered using ignore and include patterns.
+
+        The root directory is only scanned the first time and after refresh_tree() is called.
+        Files deleted since the last scan are removed without scanning again.
+        """
+        if self._files is None:
+            self._files = self._scan_files()
+        else:
+            deleted = [file for file in self._files if not file.is_file()]
+            if deleted:
+                self._files = self._files.difference(deleted)
+        return self._files
+
+    def refresh_tree(self):
+        ' Scans the root directory again, so that files created or deleted since the last scan are noticed. '
+        self._files = self._scan_files()
+
+    def _scan_files(self) -> Set[Path]:
+        ' Scans the root directory for .tex files. '
         # get all files from the workspace root
         paths = list(
             self.root.rglob('**/source/**/*.tex'))
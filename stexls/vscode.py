@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import urllib.parse
+import urllib.request
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
@@ -33,6 +35,22 @@ undefined = Undefined()
 DocumentUri = str
 
 
+@lru_cache(maxsize=4096)
+def _uri_scheme(uri: DocumentUri) -> str:
+    ' Parses the scheme of the uri. Cached because the same uris are parsed over and over again. '
+    return urllib.parse.urlparse(uri).scheme
+
+
+@lru_cache(maxsize=4096)
+def uri_to_path(uri: DocumentUri) -> Path:
+    """ Parses the path of the uri. Cached because the same uris are parsed over and over again.
+
+    Percent-encoded characters are decoded and drive letters of windows paths are handled,
+    so that this is the inverse of Path.as_uri().
+    """
+    return Path(urllib.request.url2pathname(urllib.parse.urlparse(uri).path))
+
+
 class Position:
     ' Representation of a zero indexed line and character inside a file. '''
 
@@ -49,7 +67,7 @@ class Position:
         return isinstance(other, Position) and self.line == other.line and self.character == other.character
 
     def __hash__(self):
-        return hash(hash(self.line) ^ hash(self.character))
+        return hash((self.line, self.character))
 
     def translate(self, lines: int = 0, characters: int = 0):
         """ Creates a copy of this position with the line and character
@@ -178,7 +196,7 @@ class Range:
         return isinstance(other, Range) and self.start == other.start and self.end == other.end
 
     def __hash__(self):
-        return hash(hash(self.start) ^ hash(self.end))
+        return hash((self.start.line, self.start.character, self.end.line, self.end.character))
 
     @property
     def length(self) -> Tuple[int, int]:
@@ -225,6 +243,9 @@ class Range:
         True
         '''
         if isinstance(range, Position):
+            # Most ranges are not on the line of the position, which is cheaper to check first
+            if range.line < self.start.line or range.line > self.end.line:
+                return False
             return self.start.is_before_or_equal(range) and self.end.is_after_or_equal(range)
         return self.start.is_before_or_equal(range.start) and self.end.is_after_or_equal(range.end)
 
@@ -366,7 +387,7 @@ class Range:
 
 class Location:
     def __init__(self, uri: DocumentUri, positionOrRange: Union[Position, Range]):
-        if urllib.parse.urlparse(uri).scheme != 'file':
+        if _uri_scheme(uri) != 'file':
             raise ValueError(f'uri argument is not a file uri ({uri})')
         self.uri = DocumentUri(uri)
         if isinstance(positionOrRange, Position):
@@ -383,7 +404,7 @@ class Location:
         return isinstance(other, Location) and self.uri == other.uri and self.range == other.range
 
     def __hash__(self):
-        return hash(hash(self.uri) ^ hash(self.range))
+        return hash((self.uri, self.range))
 
     def read(self, lines: Optional[Sequence[str]] = None) -> Optional[str]:
         ''' Opens the file and returns the text at the range of the location.
@@ -410,7 +431,7 @@ class Location:
     @property
     def path(self) -> Path:
         ' Returns the uri property as a posix path. '
-        return Path(urllib.parse.urlparse(self.uri).path)
+        return uri_to_path(self.uri)
 
     def contains(self, loc: Union[Location, Range, Position]) -> bool:
         ' Returns True if the loc argument is contained within this location\'s range and the file is corrent if given. '
@@ -502,8 +523,7 @@ class TextDocumentIdentifier:
     @property
     def path(self) -> Path:
         ' Converts the uri to a path object. '
-        p = urllib.parse.urlparse(self.uri)
-        return Path(p.path)
+        return uri_to_path(self.uri)
 
     def to_json(self) -> dict:
         return {'uri': str(self.uri)}
@@ -623,8 +643,7 @@ class TextDocumentItem:
     @property
     def path(self):
         ' Converts the uri to a Path object. '
-        p = urllib.parse.urlparse(self.uri)
-        return Path(p.path)
+        return uri_to_path(self.uri)
 
     def to_json(self) -> dict:
         return {'uri': self.uri, 'languageId': self.languageId, 'version': self.version, 'text': self.text}
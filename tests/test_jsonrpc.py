@@ -1,8 +1,13 @@
+import asyncio
 import logging
 from socket import socketpair
-from unittest import IsolatedAsyncioTestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 
 from stexls.jsonrpc import dispatcher, exceptions, hooks
+from stexls.jsonrpc.core import NotificationObject, RequestObject
+from stexls.jsonrpc.parser import MessageParser
+from stexls.jsonrpc.streams import JsonStream
+from stexls.vscode import DiagnosticSeverity, Position
 
 
 class GetSetServer(dispatcher.Dispatcher):
@@ -102,3 +107,43 @@ class TestJRPC(IsolatedAsyncioTestCase):
             await client.raise_error(code=-32002, message='mymessage', rpcerror=False)
         server_task.cancel()
         await client_task
+
+    async def test_stream_roundtrip(self):
+        class BufferWriter:
+            def __init__(self):
+                self.writes = []
+
+            def write(self, data: bytes):
+                self.writes.append(data)
+
+        for charset in ('utf-8', 'latin-1'):
+            writer = BufferWriter()
+            stream = JsonStream(None, writer, charset=charset, with_content_type=True)
+            stream.write_json({'position': Position(1, 2), 'severity': DiagnosticSeverity.Error, 'text': 'Größe ∀x'})
+            self.assertEqual(len(writer.writes), 1)
+            reader = asyncio.StreamReader()
+            reader.feed_data(writer.writes[0])
+            reader.feed_eof()
+            stream = JsonStream(reader, writer, charset=charset)
+            self.assertDictEqual(
+                await stream.read_json(),
+                {'position': {'line': 1, 'character': 2}, 'severity': 1, 'text': 'Größe ∀x'})
+
+
+class TestMessageParser(TestCase):
+    def test_batch(self):
+        parser = MessageParser([
+            {'jsonrpc': '2.0', 'method': 'notify', 'params': [1]},
+            {'jsonrpc': '2.0', 'method': 'request', 'id': 1},
+            {'method': 'invalid'},
+        ])
+        self.assertTrue(parser.is_batch)
+        self.assertListEqual(
+            [NotificationObject, RequestObject], [type(message) for message in parser.valid])
+        self.assertEqual(1, len(parser.errors))
+
+    def test_empty_batch(self):
+        parser = MessageParser([])
+        self.assertFalse(parser.is_batch)
+        self.assertListEqual([], parser.valid)
+        self.assertEqual(1, len(parser.errors))
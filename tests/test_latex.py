@@ -3,7 +3,7 @@ from pathlib import Path
 from unittest import TestCase
 
 from stexls.latex.parser import LatexParser
-from stexls.latex.tokenizer import LatexTokenizer
+from stexls.latex.tokenizer import LatexTokenizer, tokenize_files
 
 
 class SetupEnvironment:
@@ -76,6 +76,23 @@ class TestLatexParser(SetupEnvironment, TestCase):
         for token in parser.root.tokens:
             self.assertTupleEqual(('$',), token.envs)
 
+    def test_parse_and_walk(self):
+        def events(enter_and_exit):
+            result = []
+            enter_and_exit(
+                lambda env: result.append(
+                    ('enter', env.env_name, env.location, [arg.text for arg in env.rargs])),
+                lambda env: result.append(('exit', env.env_name)))
+            return result
+        parser = LatexParser(self.file)
+        parser.parse()
+        expected = events(parser.walk)
+        parser = LatexParser(self.file)
+        actual = events(parser.parse_and_walk)
+        self.assertListEqual(expected, actual)
+        self.assertTrue(parser.parsed)
+        self.assertIsNone(parser.root)
+
 
 class TestLatexTokenizer(SetupEnvironment, TestCase):
     def test_tokenize(self):
@@ -119,3 +136,12 @@ class TestLatexTokenizer(SetupEnvironment, TestCase):
         ]
         envs = list(map(lambda x: x.envs, tokenizer.tokens()))
         self.assertListEqual(expected_envs, envs)
+
+    def test_tokenize_files(self):
+        tokenizer = LatexTokenizer.from_file(self.file)
+        missing = self.file.with_name('missing.tex')
+        tokens, failed = tokenize_files([self.file, missing], num_jobs=2)
+        self.assertIsNone(failed)
+        self.assertListEqual(
+            [(t.lexeme, t.envs, t.range) for t in tokenizer.tokens()],
+            [(t.lexeme, t.envs, t.range) for t in tokens])
@@ -1,7 +1,10 @@
+import os
+import time
 from unittest import TestCase
 
 from stexls.linter.linter import Linter
 from stexls.util.workspace import Workspace
+from stexls.vscode import Position
 
 from tests.mock import MockGlossary
 
@@ -75,3 +78,113 @@ class TestLinter(TestCase, MockGlossary):
         result = self.linter.lint(file)
         print(result)
         raise NotImplementedError
+
+    def test_lint_files(self):
+        module = self.module_name
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'\trefi{value}\trefi{undefined}')
+        self.new_module('module2')
+        self.write_modsig(rf'\gimport{{{module}}}\symi{{other}}')
+        self.write_binding(rf'\trefi[{module}]{{value}}\trefi{{other}}')
+        files = sorted(self.workspace.files)
+        sequential = {
+            file: [d.to_json() for d in result.diagnostics]
+            for file, result in self.linter.lint_files(files)
+        }
+        parallel = {
+            file: [d.to_json() for d in result.diagnostics]
+            for file, result in self.linter.lint_files(files, num_jobs=2)
+        }
+        self.linter.close()
+        self.assertListEqual(files, list(parallel))
+        self.assertDictEqual(sequential, parallel)
+        self.assertEqual(1, sum(map(len, parallel.values())))
+
+    def test_buffered_objects_reused_until_modified(self):
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'\trefi{value}')
+        self.linter.lint(self.binding)
+        buffered = self.linter.unlinked_object_buffer[self.module]
+        self.linter.lint(self.binding)
+        self.assertIs(buffered, self.linter.unlinked_object_buffer[self.module])
+        self.write_modsig(r'\symi{other}')
+        future = time.time() + 10
+        os.utime(self.module, (future, future))
+        result = self.linter.lint(self.binding)
+        self.assertIsNot(buffered, self.linter.unlinked_object_buffer[self.module])
+        self.assertEqual(1, len(result.diagnostics))
+
+    def test_lint_result_reused_until_dependency_modified(self):
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'\trefi{value}')
+        result = self.linter.lint(self.binding)
+        self.assertIs(result, self.linter.lint(self.binding))
+        self.write_modsig(r'\symi{other}')
+        future = time.time() + 10
+        os.utime(self.module, (future, future))
+        relinted = self.linter.lint(self.binding)
+        self.assertIsNot(result, relinted)
+        self.assertEqual(1, len(relinted.diagnostics))
+        self.linter.forget_lint_result(self.binding)
+        self.assertIsNot(relinted, self.linter.lint(self.binding))
+
+    def test_references(self):
+        self.write_modsig(r'\symi{value}')
+        self.write_binding('\\trefi{value}\n\\trefi{value}')
+        self.linter.lint(self.binding)
+        position = Position(3, 3)
+        references = self.linter.references(self.binding, position)
+        self.assertListEqual(
+            [self.binding, self.binding, self.module],
+            [location.path for location in references])
+        self.write_binding('\\trefi{value}\n\\trefi{value}\\trefi{value}')
+        future = time.time() + 10
+        os.utime(self.binding, (future, future))
+        self.linter.lint(self.binding)
+        references = self.linter.references(self.binding, position)
+        self.assertListEqual(
+            [self.binding, self.binding, self.binding, self.module],
+            [location.path for location in references])
+
+    def test_lint_deleted_file(self):
+        self.write_modsig(r'\symi{value}')
+        self.assertIn(self.module, self.workspace.files)
+        self.module.unlink()
+        self.assertNotIn(self.module, self.workspace.files)
+        result = self.linter.lint(self.module)
+        self.assertListEqual([], result.diagnostics)
+
+    def test_compile_workspace_without_files_starts_no_workers(self):
+        self.write_modsig(r'\symi{value}')
+        self.assertListEqual([], self.linter.compile_workspace(0, num_jobs=4))
+        self.assertIsNone(self.linter._pool)
+
+    def test_linked_modules_reused_by_other_linter(self):
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'\trefi{value}')
+        self.linter.lint(self.binding)
+        linked = dict(self.linter.linker.cache)
+        self.assertGreater(len(linked), 0)
+        other = Linter(self.workspace, outdir=self.root)
+        result = other.lint(self.binding)
+        self.assertListEqual([], result.diagnostics)
+        # The modules were loaded from the cache directory instead of being linked again
+        for key, (time_linked, _obj) in linked.items():
+            self.assertEqual(time_linked, other.linker.cache[key][0])
+
+    def test_lint_files_size_limit(self):
+        linter = Linter(self.workspace, outdir=self.root, linter_file_size_limit_kb=1)
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'\trefi{undefined}' + '%' * 4096)
+        files = [self.module, self.binding]
+        sequential = {
+            file: [d.to_json() for d in result.diagnostics]
+            for file, result in linter.lint_files(files)
+        }
+        parallel = {
+            file: [d.to_json() for d in result.diagnostics]
+            for file, result in linter.lint_files(files, num_jobs=2)
+        }
+        linter.close()
+        self.assertDictEqual(sequential, parallel)
+        self.assertListEqual([], parallel[self.binding])
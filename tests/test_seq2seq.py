@@ -0,0 +1,179 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+try:
+    from stexls.trefier.models import seq2seq
+except ImportError:
+    # The trefier requires tensorflow and the other machine learning dependencies
+    seq2seq = None
+
+
+class _FeatureModel:
+    ' Feature model that maps every token of a document to a vector filled with the length of the document. '
+
+    def __init__(self, *shape: int):
+        self.shape = shape
+
+    def transform(self, documents):
+        return [np.full((len(document), *self.shape), len(document), dtype=np.float32) for document in documents]
+
+    predict = transform
+
+
+@skipIf(seq2seq is None, 'tensorflow is not installed')
+class TestSeq2SeqPredict(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.dir.name)
+        self.model = seq2seq.Seq2SeqModel()
+        self.model.glove = _FeatureModel(10)
+        self.model.tfidf_model = _FeatureModel()
+        self.model.keyphraseness_model = _FeatureModel()
+        self.model.pos_tag_model = _FeatureModel(35)
+        # Number of documents of each batch given to the model
+        self.batches = []
+
+        def predict_inputs(inputs):
+            self.batches.append(len(inputs['tokens']))
+            # The prediction of each token is the length of the document it is in
+            return inputs['tokens'][:, :, :1] / 100
+        self.model._predict_inputs = predict_inputs
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name: str, content: str) -> Path:
+        file = self.root / name
+        file.write_text(content)
+        return file
+
+    def labels(self, results):
+        return [[round(tag.label, 4) for tag in result] for result in results]
+
+    def test_predict_cached(self):
+        three = self.write('three.tex', 'first second third')
+        one = self.write('one.tex', 'single')
+        self.assertListEqual(
+            [[0.03] * 3, [0.01]], self.labels(self.model.predict(three, one)))
+        self.assertListEqual([2], self.batches)
+        # Cached predictions are returned in input order without running the model again
+        self.assertListEqual(
+            [[0.01], [0.03] * 3], self.labels(self.model.predict(one, three)))
+        self.assertListEqual([2], self.batches)
+        # Only the file with new content is predicted
+        self.write('one.tex', 'two words')
+        self.assertListEqual(
+            [[0.03] * 3, [0.02] * 2], self.labels(self.model.predict(three, one)))
+        self.assertListEqual([2, 1], self.batches)
+
+    def test_predict_unreadable_file_left_out(self):
+        one = self.write('one.tex', 'single')
+        missing = self.root / 'missing.tex'
+        self.assertListEqual(
+            [[0.01]], self.labels(self.model.predict(missing, one)))
+        self.assertListEqual([1], self.batches)
+
+    def test_predict_cache_evicts_least_recently_used(self):
+        cache_size = seq2seq._PREDICTION_CACHE_SIZE
+        seq2seq._PREDICTION_CACHE_SIZE = 2
+        self.addCleanup(setattr, seq2seq, '_PREDICTION_CACHE_SIZE', cache_size)
+        a = self.write('a.tex', 'a')
+        b = self.write('b.tex', 'b b')
+        c = self.write('c.tex', 'c c c')
+        self.model.predict(a)
+        self.model.predict(b)
+        # Using a makes b the least recently used prediction
+        self.model.predict(a)
+        self.model.predict(c)
+        self.assertListEqual([1, 1, 1], self.batches)
+        self.model.predict(a, c)
+        self.assertListEqual([1, 1, 1], self.batches)
+        self.model.predict(b)
+        self.assertListEqual([1, 1, 1, 1], self.batches)
+
+
+class _KerasModel:
+    ' Keras model that predicts the given output. '
+
+    def __init__(self, output: np.ndarray):
+        self.output = output
+
+    def predict(self, inputs):
+        return self.output
+
+
+class _Interpreter:
+    ' Tflite interpreter that records the input shapes and predicts the given output. '
+
+    def __init__(self, output: np.ndarray):
+        self.output = output
+        self.shapes = {}
+        self.invoked = False
+
+    def get_input_details(self):
+        return [
+            {'index': i, 'name': f'serving_default_{name}:0'}
+            for i, name in enumerate(('tokens', 'tfidf', 'keyphraseness', 'pos'))
+        ]
+
+    def resize_tensor_input(self, index, shape):
+        self.shapes[index] = shape
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        assert self.shapes[index] == value.shape
+
+    def invoke(self):
+        self.invoked = True
+
+    def get_output_details(self):
+        return [{'index': 0}]
+
+    def get_tensor(self, index):
+        return self.output
+
+
+class _FailingInterpreter(_Interpreter):
+    def invoke(self):
+        raise RuntimeError('Unsupported operation')
+
+
+@skipIf(seq2seq is None, 'tensorflow is not installed')
+class TestSeq2SeqInference(TestCase):
+    def setUp(self):
+        self.inputs = {
+            'tokens': np.zeros((2, 5, 10), dtype=np.float32),
+            'tfidf': np.zeros((2, 5, 1), dtype=np.float32),
+            'keyphraseness': np.zeros((2, 5, 1), dtype=np.float32),
+            'pos': np.zeros((2, 5, 35), dtype=np.float32),
+        }
+        self.keras_output = np.full((2, 5, 1), 0.5, dtype=np.float32)
+        self.model = seq2seq.Seq2SeqModel()
+        self.model.model = _KerasModel(self.keras_output)
+
+    def test_quantized_model_resized_to_inputs(self):
+        quantized_output = np.full((2, 5, 1), 0.25, dtype=np.float32)
+        interpreter = _Interpreter(quantized_output)
+        self.model.quantized_model = interpreter
+        self.assertIs(quantized_output, self.model._predict_inputs(self.inputs))
+        self.assertDictEqual(
+            {0: (2, 5, 10), 1: (2, 5, 1), 2: (2, 5, 1), 3: (2, 5, 35)}, interpreter.shapes)
+
+    def test_failing_quantized_model_falls_back_to_keras(self):
+        self.model.quantized_model = _FailingInterpreter(self.keras_output)
+        self.assertIs(self.keras_output, self.model._predict_inputs(self.inputs))
+        # The quantized model is not tried again
+        self.assertIsNone(self.model.quantized_model)
+        self.assertIs(self.keras_output, self.model._predict_inputs(self.inputs))
+
+    def test_quantized_model_validated_against_keras(self):
+        close = self.keras_output + seq2seq._QUANTIZATION_TOLERANCE / 2
+        far = self.keras_output + seq2seq._QUANTIZATION_TOLERANCE * 2
+        self.assertTrue(self.model._is_close_to_keras(_Interpreter(close), self.inputs))
+        self.assertFalse(self.model._is_close_to_keras(_Interpreter(far), self.inputs))
+        self.assertFalse(self.model._is_close_to_keras(_FailingInterpreter(close), self.inputs))
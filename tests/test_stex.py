@@ -1,6 +1,8 @@
+import difflib
+import os
 from unittest import TestCase
 
-from stexls.stex.compiler import Compiler
+from stexls.stex.compiler import Compiler, _get_close_matches
 from stexls.stex.diagnostics import DiagnosticCodeName
 from stexls.stex.linker import Linker
 from stexls.stex.parser import (DefiIntermediateParseTree, IntermediateParser,
@@ -248,6 +250,30 @@ class TestCompiler(TestCase, MockGlossary):
             DiagnosticCodeName.MTREF_QUESTIONMARK_CHECK.value,
             codes)
 
+    def test_unchanged_content_not_recompiled(self):
+        file = self.write_binding(r'\defi{value}')
+        compiler = Compiler(self.root, self.source)
+        obj = compiler.compile(file)
+        # Make the objectfile look outdated
+        os.utime(compiler.get_objectfile_path(file), (0, 0))
+        self.assertTrue(compiler.recompilation_required(file))
+        loaded = compiler.compile_or_load_from_file(file, None, None)
+        self.assertEqual(loaded.creation_time, obj.creation_time)
+        self.assertFalse(compiler.recompilation_required(file))
+        os.utime(compiler.get_objectfile_path(file), (0, 0))
+        changed = compiler.compile_or_load_from_file(
+            file, file.read_text() + r'\defi{other}', None)
+        self.assertNotEqual(changed.content_hash, obj.content_hash)
+
+
+class TestGetCloseMatches(TestCase):
+    def test_same_as_difflib(self):
+        possibilities = ['???cd', '???AB', 'ab', 'a-b', 'module?symbol', 'other']
+        for word in ('???ab', 'AB', 'module?symbl', 'x'):
+            self.assertListEqual(
+                difflib.get_close_matches(word, possibilities),
+                _get_close_matches(word, possibilities))
+
 
 class TestIntermediate(TestCase, MockGlossary):
     """ This intermediate test is only for basic "does not crash" tests.
@@ -314,6 +340,26 @@ class TestLinker(TestCase, MockGlossary):
         qualified_symbol, = binding.find([self.module_name, 'value'])
         self.assertIsInstance(qualified_symbol, DefSymbol)
 
+    def test_link_cache_dir(self):
+        self.write_modsig(r'\symi{value}')
+        self.write_binding(r'Reference symi: \trefi{value}')
+        compiler = Compiler(self.root, self.source)
+        objects = {
+            self.module: compiler.compile(self.module),
+            self.binding: compiler.compile(self.binding),
+        }
+        cache_dir = self.root / 'linked'
+        Linker(self.root, cache_dir).link(self.binding, objects, compiler)
+        self.assertEqual(len(list(cache_dir.glob('*.stexlink'))), 1)
+        linker = Linker(self.root, cache_dir)
+        self.assertFalse(linker._relink_required(
+            objects, self.module, self.module_name, False))
+        linked_binding = linker.link(self.binding, objects, compiler)
+        self.assertListEqual([], linked_binding.diagnostics.diagnostics)
+        objects[self.module] = compiler.compile(self.module)
+        self.assertTrue(linker._relink_required(
+            objects, self.module, self.module_name, False))
+
     def test_missing_dependency(self):
         self.write_binding(r'''
             Reference symi: \trefi{value}
@@ -329,3 +375,23 @@ class TestLinker(TestCase, MockGlossary):
         self.assertEqual(
             DiagnosticCodeName.FILE_NOT_FOUND.value, file_not_found.code)
         self.assertIn(str(self.module), file_not_found.message)
+
+    def test_link_import_chain(self):
+        compiler = Compiler(self.root, self.source)
+        objects = {}
+        names = [f'module{i}' for i in range(5)]
+        for name, imported in zip(names, names[1:] + [None]):
+            file = self.source / f'{name}.tex'
+            gimport = rf'\gimport{{{imported}}}' if imported else ''
+            file.write_text(rf'''
+                \begin{{modsig}}{{{name}}}
+                    {gimport}
+                    \symi{{{name}-symbol}}
+                \end{{modsig}}''')
+            objects[file] = compiler.compile(file)
+        linked = Linker(self.root).link(
+            self.source / f'{names[0]}.tex', objects, compiler)
+        self.assertListEqual([], linked.diagnostics.diagnostics)
+        symbol, = linked.symbol_table.lookup(
+            [names[0], names[-1], f'{names[-1]}-symbol'])
+        self.assertIsInstance(symbol, DefSymbol)
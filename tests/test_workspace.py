@@ -1,8 +1,11 @@
+import os
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 from unittest import TestCase
 
+from stexls.util.file_watcher import WorkspaceWatcher
 from stexls.util.workspace import Workspace
+from stexls.vscode import Position, Range
 
 
 class TestWorkspace(TestCase):
@@ -17,3 +20,76 @@ class TestWorkspace(TestCase):
             for file in files:
                 match = ws.ignorefile.match(file)
                 self.assertFalse(match)
+
+    def test_patch_file(self):
+        with TemporaryDirectory() as tmpdir:
+            file = Path(tmpdir).resolve() / 'repo/source/file.tex'
+            file.parent.mkdir(parents=True)
+            file.write_text('')
+            ws = Workspace(tmpdir)
+            self.assertTrue(ws.open_file(file, 1, 'first line\nsecond line\n'))
+            self.assertTrue(ws.patch_file(
+                file, 2, Range(Position(1, 0), Position(1, 6)), 'last'))
+            self.assertEqual(ws.read_buffer(file), 'first line\nlast line\n')
+            self.assertTrue(ws.patch_file(
+                file, 3, Range(Position(0, 5), Position(1, 4)), ''))
+            self.assertEqual(ws.read_buffer(file), 'first line\n')
+            self.assertTrue(ws.patch_file(
+                file, 4, Range(Position(0, 100), Position(5, 0)), '!'))
+            self.assertEqual(ws.read_buffer(file), 'first line!')
+            self.assertFalse(ws.patch_file(
+                file, 3, Range(Position(0, 0)), 'old version'))
+            self.assertEqual(ws.get_version(file), 4)
+
+    def test_patch_file_utf16_positions(self):
+        with TemporaryDirectory() as tmpdir:
+            file = Path(tmpdir).resolve() / 'repo/source/file.tex'
+            file.parent.mkdir(parents=True)
+            file.write_text('')
+            ws = Workspace(tmpdir)
+            self.assertTrue(ws.open_file(file, 1, 'first\na\U0001d538b\n'))
+            # The astral character takes two UTF-16 code units
+            self.assertTrue(ws.patch_file(
+                file, 2, Range(Position(1, 3), Position(1, 3)), 'X'))
+            self.assertEqual(ws.read_buffer(file), 'first\na\U0001d538Xb\n')
+            self.assertTrue(ws.patch_file(
+                file, 3, Range(Position(1, 1), Position(1, 4)), 'ä'))
+            self.assertEqual(ws.read_buffer(file), 'first\naäb\n')
+
+    def test_deleted_file(self):
+        with TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / 'repo/source'
+            source.mkdir(parents=True)
+            kept, deleted = source / 'kept.tex', source / 'deleted.tex'
+            kept.write_text('')
+            deleted.write_text('')
+            ws = Workspace(tmpdir)
+            self.assertSetEqual(ws.files, {kept, deleted})
+            deleted.unlink()
+            self.assertSetEqual(ws.files, {kept})
+
+
+class TestWorkspaceWatcher(TestCase):
+    def test_update(self):
+        with TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            (root / 'a/b').mkdir(parents=True)
+            (root / 'a/b/dir.tex').mkdir()
+            files = [root / 'x.tex', root / 'a/y.tex', root / 'a/b/z.tex']
+            for file in files:
+                file.write_text('content')
+            (root / 'a/ignored.txt').write_text('content')
+            watcher = WorkspaceWatcher(str(root / '**/*.tex'), max_workers=4)
+            changes = watcher.update()
+            self.assertSetEqual(changes.created, set(files))
+            self.assertSetEqual(changes.modified, set())
+            self.assertSetEqual(changes.deleted, set())
+            os.utime(files[0], (0, 0))
+            files[1].unlink()
+            new_file = root / 'a/b/new.tex'
+            new_file.write_text('content')
+            changes = watcher.update()
+            self.assertSetEqual(changes.created, {new_file})
+            self.assertSetEqual(changes.modified, {files[0]})
+            self.assertSetEqual(changes.deleted, {files[1]})
+            self.assertSetEqual(set(watcher.files), {files[0], files[2], new_file})